@@ -0,0 +1,160 @@
+"""Кеш ответов API с инвалидацией по версиям объектов."""
+import time
+from collections import namedtuple
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from api.metrics import count_cache
+
+COLLECTION = 'recipes'
+
+UserFlags = namedtuple(
+    'UserFlags', ('favorites', 'shopping_cart', 'subscriptions')
+)
+
+
+def version_key(kind, pk=None):
+    if pk is None:
+        return f'version:{kind}'
+    return f'version:{kind}:{pk}'
+
+
+def initial_version():
+    """Начальная версия по часам: после сброса кеша версии не повторяются."""
+    return time.time_ns()
+
+
+def get_versions(keys):
+    """Текущие версии ключей; отсутствующие заводятся с initial_version."""
+    cache = caches[settings.RECIPES_CACHE_ALIAS]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        version = initial_version()
+        for key in missing:
+            cache.add(key, version, None)
+        versions.update(cache.get_many(missing))
+    return versions
+
+
+def bump_versions(keys):
+    """Сменить версии объектов, чтобы зависящие от них записи устарели."""
+    cache = caches[settings.RECIPES_CACHE_ALIAS]
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, initial_version(), None)
+
+
+def get_user_flags(user):
+    """Id избранных рецептов, рецептов в корзине и авторов в подписках.
+
+    Множества кешируются под ключом с версией пользователя: действия
+    с избранным, корзиной и подписками меняют версию, и следующий
+    запрос пересобирает их тремя запросами к базе.
+    """
+    cache = caches[settings.RECIPES_CACHE_ALIAS]
+    version = cache.get(version_key('user-flags', user.pk), 0)
+    key = f'user-flags:{user.pk}:{version}'
+    flags = cache.get(key)
+    if flags is None:
+        flags = UserFlags(
+            favorites=frozenset(
+                user.favorite.values_list('recipe_id', flat=True)
+            ),
+            shopping_cart=frozenset(
+                user.shopping_cart.values_list('recipe_id', flat=True)
+            ),
+            subscriptions=frozenset(
+                user.follower.values_list('author_id', flat=True)
+            ),
+        )
+        cache.set(key, flags, settings.RECIPES_CACHE_TIMEOUT)
+    return flags
+
+
+def invalidate_user_flags(user):
+    transaction.on_commit(
+        lambda: bump_versions([version_key('user-flags', user.pk)])
+    )
+
+
+def overlay_user_flags(data, flags):
+    """Проставить флаги пользователя в общий ответ с рецептами."""
+    recipes = data['results'] if 'results' in data else [data]
+    for recipe in recipes:
+        recipe['is_favorited'] = recipe['id'] in flags.favorites
+        recipe['is_in_shopping_cart'] = recipe['id'] in flags.shopping_cart
+        recipe['author']['is_subscribed'] = (
+            recipe['author']['id'] in flags.subscriptions
+        )
+    return data
+
+
+def get_recipe_dependencies(recipe):
+    """Ключи версий всех объектов, отрисованных в рецепте."""
+    yield version_key('recipe', recipe['id'])
+    yield version_key('user', recipe['author']['id'])
+    for tag in recipe['tags']:
+        yield version_key('tag', tag['id'])
+    for ingredient in recipe['ingredients']:
+        yield version_key('ingredient', ingredient['id'])
+
+
+class ResponseCache:
+    """Кеш сериализованных ответов.
+
+    Вместе с ответом хранятся версии объектов, из которых он собран.
+    При чтении версии сверяются одним get_many: изменение любого
+    объекта делает запись недействительной, не затрагивая остальные.
+    """
+
+    prefix = 'response'
+
+    @property
+    def cache(self):
+        return caches[settings.RECIPES_CACHE_ALIAS]
+
+    def get_key(self, request):
+        url = request.build_absolute_uri()
+        return f'{self.prefix}:{md5(url.encode()).hexdigest()}'
+
+    def get_versions(self, keys):
+        versions = self.cache.get_many(keys)
+        return {key: versions.get(key, 0) for key in keys}
+
+    def get(self, key):
+        entry = self.cache.get(key)
+        if entry is None or self.get_versions(
+            list(entry['versions'])
+        ) != entry['versions']:
+            count_cache('miss')
+            return None
+        count_cache('hit')
+        return entry['data']
+
+    def set(self, key, data, versions):
+        """Сохранить ответ.
+
+        versions - версии, прочитанные до сборки ответа: для них запись
+        устареет, даже если объект изменился во время сериализации.
+        """
+        recipes = data['results'] if 'results' in data else [data]
+        keys = {
+            dependency
+            for recipe in recipes
+            for dependency in get_recipe_dependencies(recipe)
+        } - versions.keys()
+        self.cache.set(
+            key,
+            {'versions': {**self.get_versions(list(keys)), **versions},
+             'data': data},
+            settings.RECIPES_CACHE_TIMEOUT
+        )
+
+
+recipes_cache = ResponseCache()
@@ -0,0 +1,100 @@
+"""Условные запросы: ETag проверяется до загрузки и сериализации.
+
+Теги и ингредиенты хешируются по строкам базы. ETag рецепта строится
+из updated_at и счетчиков версий в кеше; счетчики начинаются со
+значения часов, поэтому после сброса кеша ETag не повторяется.
+"""
+from hashlib import md5
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag
+from rest_framework import status
+
+from api.metrics import CACHE_REQUESTS
+from recipes.ingredient_index import ingredient_index
+from recipes.models import Ingredients, Recipes, Tags
+from .cache import get_versions, version_key
+
+
+def make_etag(*parts):
+    return quote_etag(
+        md5(':'.join(map(str, parts)).encode()).hexdigest()
+    )
+
+
+def tags_etag(request, pk=None):
+    """Хеш строк тегов: таблица маленькая, запрос дешевле сериализации."""
+    tags = Tags.objects.order_by('id')
+    if pk is not None:
+        tags = tags.filter(pk=pk)
+    rows = list(tags.values_list('id', 'name', 'slug'))
+    if pk is not None and not rows:
+        return None
+    return make_etag('tags', *rows)
+
+
+def ingredients_etag(request, pk=None):
+    """Для списка - хеш содержимого индекса, из которого он отдается."""
+    if pk is None:
+        return make_etag(
+            'ingredients', ingredient_index.digest,
+            request.query_params.urlencode()
+        )
+    row = Ingredients.objects.filter(pk=pk).values_list(
+        'id', 'name', 'measurement_unit'
+    ).first()
+    if row is None:
+        return None
+    return make_etag('ingredient', *row)
+
+
+def recipe_etag(request, pk):
+    """ETag рецепта одним запросом за updated_at и автором.
+
+    Кроме даты изменения учитываются версии рецепта (состав меняется без
+    сохранения самого рецепта), автора, тегов и ингредиентов, а для
+    пользователя - версия его флагов избранного, корзины и подписок.
+    Last-Modified не отдается: по одной дате нельзя заметить изменение
+    флагов. Для несуществующего рецепта возвращает None.
+    """
+    row = Recipes.objects.filter(pk=pk).values_list(
+        'updated_at', 'author_id'
+    ).first()
+    if row is None:
+        return None
+    updated_at, author_id = row
+    keys = [
+        version_key('recipe', pk),
+        version_key('user', author_id),
+        version_key('tags'),
+        version_key('ingredients'),
+    ]
+    user = request.user
+    if not user.is_anonymous:
+        keys.append(version_key('user-flags', user.pk))
+    versions = get_versions(keys)
+    return make_etag(
+        'recipe', pk, updated_at.isoformat(),
+        request.query_params.urlencode(),
+        *(versions[key] for key in keys),
+    )
+
+
+def conditional_response(get_etag, handler, request, *args, **kwargs):
+    """Ответить 304, если ETag клиента совпал, иначе вызвать handler."""
+    try:
+        etag = get_etag(request, *args, **kwargs)
+    except (TypeError, ValueError):
+        etag = None
+    if etag is not None:
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            CACHE_REQUESTS.labels('etag', 'hit').inc()
+            patch_vary_headers(response, ('Authorization',))
+            return response
+        CACHE_REQUESTS.labels('etag', 'miss').inc()
+    response = handler(request, *args, **kwargs)
+    if etag is not None and response.status_code == status.HTTP_200_OK:
+        response['ETag'] = etag
+    patch_vary_headers(response, ('Authorization',))
+    return response
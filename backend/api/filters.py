@@ -1,6 +1,16 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F, Q
 from django_filters.rest_framework import FilterSet, filters
+from rest_framework.exceptions import ValidationError
 
-from recipes.models import Tags, Ingredients, Recipes
+from recipes.models import SEARCH_CONFIG, Tags, Ingredients, Recipes
+from .paginators import LimitKeysetPaginator
+
+SEARCH_CURSOR_MESSAGE = (
+    'Результаты поиска упорядочены по релевантности и не поддерживают '
+    'cursor: используйте page.'
+)
 
 
 class IngredientFilter(FilterSet):
@@ -24,6 +34,7 @@ class TagsFilter(FilterSet):
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipes
@@ -37,3 +48,24 @@ class TagsFilter(FilterSet):
     def filter_is_in_shopping_cart(self, queryset, name, value):
         if value:
             return queryset.filter(shopping_cart__user=self.request.user)
+
+    def filter_search(self, queryset, name, value):
+        """Полнотекстовый поиск, результаты упорядочены по релевантности.
+
+        Курсор хранит только поля keyset_ordering, поэтому вместе с
+        поиском он отбросил бы сортировку по rank: такой запрос
+        отклоняется.
+        """
+        cursor_query_param = LimitKeysetPaginator.cursor_query_param
+        if cursor_query_param in self.request.query_params:
+            raise ValidationError({cursor_query_param: SEARCH_CURSOR_MESSAGE})
+        if connection.vendor != 'postgresql':
+            return queryset.filter(
+                Q(name__icontains=value) | Q(text__icontains=value)
+            )
+        query = SearchQuery(
+            value, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-is_published')
@@ -0,0 +1,172 @@
+"""Метрики Prometheus.
+
+Если задана переменная окружения PROMETHEUS_MULTIPROC_DIR, каждый
+процесс gunicorn пишет значения в свои файлы в этом каталоге, а
+эндпоинт /metrics собирает их вместе, поэтому ответ не зависит от
+того, какой воркер его обслужил.
+"""
+import ipaddress
+import os
+import time
+from contextvars import ContextVar
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+UNMATCHED_ROUTE = 'unmatched'
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+UPLOAD_BUCKETS = tuple(
+    size * 1024 for size in (16, 64, 256, 512, 1024, 2048, 4096, 7168)
+)
+
+REQUEST_LATENCY = Histogram(
+    'foodgram_request_duration_seconds',
+    'Время обработки запроса.',
+    ('route', 'method'),
+)
+REQUESTS = Counter(
+    'foodgram_requests_total',
+    'Число ответов по кодам.',
+    ('route', 'method', 'status'),
+)
+DB_QUERIES = Histogram(
+    'foodgram_db_queries_per_request',
+    'Число SQL-запросов на один запрос.',
+    ('route',),
+    buckets=QUERY_BUCKETS,
+)
+DB_DURATION = Histogram(
+    'foodgram_db_duration_seconds',
+    'Суммарное время SQL-запросов на один запрос.',
+    ('route',),
+)
+SHORT_LINK_REDIRECTS = Counter(
+    'foodgram_short_link_redirects_total',
+    'Переходы по коротким ссылкам.',
+    ('kind',),
+)
+IMAGE_UPLOAD_BYTES = Histogram(
+    'foodgram_image_upload_bytes',
+    'Размер загруженных изображений.',
+    ('source',),
+    buckets=UPLOAD_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    'foodgram_cache_requests_total',
+    'Обращения к кешу ответов и проверки ETag.',
+    ('cache', 'result'),
+)
+
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+class RequestMetrics:
+    """Счетчики одного запроса."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.view_finished = None
+        self.render_time = 0.0
+        self.serialize_time = 0.0
+        self.queries = 0
+        self.sql_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_sql = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def view_time(self):
+        if self.view_started is None or self.view_finished is None:
+            return 0.0
+        return self.view_finished - self.view_started
+
+    def add_query(self, sql, duration):
+        self.queries += 1
+        self.sql_time += duration
+        if duration > self.slowest_time:
+            self.slowest_time = duration
+            self.slowest_sql = sql
+
+
+def count_cache(event):
+    """Учесть попадание или промах кеша ответов в текущем запросе."""
+    CACHE_REQUESTS.labels('response', event).inc()
+    metrics = current_metrics.get()
+    if metrics is None:
+        return
+    if event == 'hit':
+        metrics.cache_hits += 1
+    else:
+        metrics.cache_misses += 1
+
+
+def milliseconds(seconds):
+    return round(seconds * 1000, 2)
+
+
+def time_serialization(serializer):
+    """Учитывать время to_representation serializer в текущем запросе.
+
+    Оборачивается только корневой сериализатор ответа: вложенные входят
+    в его время.
+    """
+    to_representation = serializer.to_representation
+
+    def timed(instance):
+        metrics = current_metrics.get()
+        if metrics is None:
+            return to_representation(instance)
+        started = time.perf_counter()
+        try:
+            return to_representation(instance)
+        finally:
+            metrics.serialize_time += time.perf_counter() - started
+
+    serializer.to_representation = timed
+    return serializer
+
+
+def observe_request(request, response, metrics, duration):
+    match = request.resolver_match
+    route = match.view_name if match else UNMATCHED_ROUTE
+    REQUEST_LATENCY.labels(route, request.method).observe(duration)
+    REQUESTS.labels(route, request.method, response.status_code).inc()
+    DB_QUERIES.labels(route).observe(metrics.queries)
+    DB_DURATION.labels(route).observe(metrics.sql_time)
+
+
+def get_registry():
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render_metrics():
+    """Тело ответа /metrics и его тип содержимого."""
+    return generate_latest(get_registry()), CONTENT_TYPE_LATEST
+
+
+def is_allowed(address, networks):
+    """Адрес входит в одну из сетей; пустой список разрешает всем."""
+    if not networks:
+        return True
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(network, strict=False)
+        for network in networks
+    )
@@ -0,0 +1,163 @@
+"""Замеры времени запросов: заголовок Server-Timing и JSON-логи."""
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from api.metrics import (
+    RequestMetrics,
+    current_metrics,
+    milliseconds,
+    observe_request,
+)
+
+logger = logging.getLogger('api.performance')
+
+SLOWEST_QUERY_LENGTH = 500
+
+
+class PerformanceMiddleware:
+    """Время обработки, SQL и кеш для каждого запроса.
+
+    Все SQL-запросы проходят через execute_wrapper, поэтому число,
+    суммарное время и самый медленный запрос известны без DEBUG.
+    view - время представления, serialize - входящее в него построение
+    данных сериализаторами, render - преобразование ответа DRF в JSON.
+    Потоковый ответ формируется при чтении: замеры продолжаются, пока
+    его читают, и завершаются после последнего фрагмента, а заголовок
+    Server-Timing у него не ставится - к этому моменту заголовки уже
+    отправлены. Запрос попадает в лог с вероятностью
+    PERFORMANCE_LOG_SAMPLE_RATE, а медленнее PERFORMANCE_SLOW_REQUEST_MS
+    - всегда, с уровнем WARNING. Те же замеры попадают в метрики
+    Prometheus.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        with self.collect(metrics):
+            response = self.get_response(request)
+        if metrics.view_started is not None and (
+            metrics.view_finished is None
+        ):
+            metrics.view_finished = time.perf_counter()
+        if response.streaming:
+            response.streaming_content = self.stream(
+                request, response, metrics, response.streaming_content
+            )
+            return response
+        duration = self.finish(request, response, metrics)
+        if settings.SERVER_TIMING or getattr(
+            getattr(request, 'user', None), 'is_staff', False
+        ):
+            response['Server-Timing'] = self.server_timing(metrics, duration)
+        return response
+
+    @contextmanager
+    def collect(self, metrics):
+        """Учитывать SQL-запросы и кеш в metrics внутри блока."""
+        token = current_metrics.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(self.execute_wrapper)
+                    )
+                yield
+        finally:
+            current_metrics.reset(token)
+
+    def stream(self, request, response, metrics, content):
+        """Отдать потоковый ответ, замеряя чтение каждого фрагмента."""
+        iterator = iter(content)
+        try:
+            while True:
+                with self.collect(metrics):
+                    chunk = next(iterator, None)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        """Записать метрики и лог запроса, вернуть его длительность."""
+        duration = time.perf_counter() - metrics.started
+        if settings.METRICS_ENABLED:
+            observe_request(request, response, metrics, duration)
+        slow = duration * 1000 >= settings.PERFORMANCE_SLOW_REQUEST_MS
+        if slow or random.random() < settings.PERFORMANCE_LOG_SAMPLE_RATE:
+            self.log(request, response, metrics, duration, slow)
+        return duration
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        """Отрисовать ответ DRF здесь, чтобы замерить время рендеринга."""
+        metrics = current_metrics.get()
+        if metrics is None:
+            return response
+        metrics.view_finished = time.perf_counter()
+        response.render()
+        metrics.render_time = time.perf_counter() - metrics.view_finished
+        return response
+
+    @staticmethod
+    def execute_wrapper(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            metrics = current_metrics.get()
+            if metrics is not None:
+                metrics.add_query(sql, time.perf_counter() - started)
+
+    @staticmethod
+    def server_timing(metrics, duration):
+        return ', '.join((
+            f'total;dur={milliseconds(duration)}',
+            f'view;dur={milliseconds(metrics.view_time)}',
+            f'serialize;dur={milliseconds(metrics.serialize_time)}',
+            f'db;dur={milliseconds(metrics.sql_time)};'
+            f'desc="{metrics.queries} queries"',
+            f'render;dur={milliseconds(metrics.render_time)}',
+            f'cache;desc="hit {metrics.cache_hits} '
+            f'miss {metrics.cache_misses}"',
+        ))
+
+    @staticmethod
+    def log(request, response, metrics, duration, slow):
+        match = request.resolver_match
+        logger.log(
+            logging.WARNING if slow else logging.INFO,
+            json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'route': match.view_name if match else None,
+                'status': response.status_code,
+                'duration_ms': milliseconds(duration),
+                'view_ms': milliseconds(metrics.view_time),
+                'serialize_ms': milliseconds(metrics.serialize_time),
+                'render_ms': milliseconds(metrics.render_time),
+                'db_queries': metrics.queries,
+                'db_ms': milliseconds(metrics.sql_time),
+                'slowest_query_ms': milliseconds(metrics.slowest_time),
+                'slowest_query': (
+                    metrics.slowest_sql[:SLOWEST_QUERY_LENGTH]
+                    if metrics.slowest_sql else None
+                ),
+                'cache_hits': metrics.cache_hits,
+                'cache_misses': metrics.cache_misses,
+                'streaming': response.streaming,
+                'slow': slow,
+            }, ensure_ascii=False)
+        )
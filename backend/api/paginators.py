@@ -1,4 +1,14 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+
+from django.core.exceptions import ValidationError
+from django.db.backends.base.operations import BaseDatabaseOperations
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class LimitPageNumberPaginator(PageNumberPagination):
@@ -6,3 +16,158 @@ class LimitPageNumberPaginator(PageNumberPagination):
 
     page_size = 6
     page_size_query_param = 'limit'
+
+
+class LimitKeysetPaginator(BasePagination):
+    """Пагинация по ключу сортировки без OFFSET и COUNT.
+
+    Курсор хранит значения полей сортировки последней (или первой)
+    записи страницы, следующая страница выбирается условием по этим
+    значениям и читается по составному индексу. Поля сортировки
+    задаются атрибутом keyset_ordering представления и должны вместе
+    однозначно определять запись.
+    """
+
+    page_size = LimitPageNumberPaginator.page_size
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    ordering = ('-is_published', '-id')
+    invalid_cursor_message = 'Некорректный курсор.'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return page_size if page_size > 0 else self.page_size
+
+    def decode_cursor(self, request, model):
+        """Направление и значения полей сортировки из курсора.
+
+        Значения приводятся к типам полей модели: курсор приходит от
+        клиента, и ошибка в нем должна давать 404, а не 500. Диапазон
+        целых проверяется по общим для всех СУБД пределам, потому что
+        SQLite своих не сообщает.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return False, None
+        try:
+            reverse, values = json.loads(urlsafe_b64decode(encoded.encode()))
+        except (BinasciiError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        fields = [
+            model._meta.get_field(field.lstrip('-')) for field in self.ordering
+        ]
+        try:
+            values = [
+                field.to_python(value) for field, value in zip(fields, values)
+            ]
+            for field, value in zip(fields, values):
+                field.run_validators(value)
+                bounds = BaseDatabaseOperations.integer_field_ranges.get(
+                    field.get_internal_type()
+                )
+                if bounds and not bounds[0] <= value <= bounds[1]:
+                    raise ValueError(value)
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in values:
+            raise NotFound(self.invalid_cursor_message)
+        return bool(reverse), values
+
+    def encode_cursor(self, reverse, instance):
+        values = []
+        for field in self.ordering:
+            value = getattr(instance, field.lstrip('-'))
+            values.append(
+                value.isoformat() if hasattr(value, 'isoformat') else value
+            )
+        encoded = urlsafe_b64encode(
+            json.dumps([int(reverse), values]).encode()
+        ).decode()
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded
+        )
+
+    def get_keyset_filter(self, values, reverse):
+        """Условие «строка после values» в порядке сортировки."""
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            step = Q(**{f'{name}__{"lt" if descending else "gt"}': values[i]})
+            for previous, value in zip(self.ordering[:i], values):
+                step &= Q(**{previous.lstrip('-'): value})
+            condition |= step
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.ordering = getattr(view, 'keyset_ordering', self.ordering)
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        reverse, values = self.decode_cursor(request, queryset.model)
+        ordering = self.ordering
+        if reverse:
+            ordering = [
+                field[1:] if field.startswith('-') else f'-{field}'
+                for field in ordering
+            ]
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(
+                self.get_keyset_filter(values, reverse)
+            )
+        page = list(queryset[:page_size + 1])
+        has_more = len(page) > page_size
+        page = page[:page_size]
+        if reverse:
+            page.reverse()
+        self.has_next = has_more if not reverse else values is not None
+        self.has_previous = has_more if reverse else values is not None
+        self.page = page
+        return page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(False, self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(True, self.page[0])
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class FeedPaginator(LimitPageNumberPaginator):
+    """Постраничная пагинация или, если передан cursor, пагинация по ключу.
+
+    Для первой страницы в режиме курсора достаточно пустого ?cursor=.
+    """
+
+    keyset_paginator_class = LimitKeysetPaginator
+    keyset_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        cursor_query_param = self.keyset_paginator_class.cursor_query_param
+        if cursor_query_param not in request.query_params:
+            self.keyset_paginator = None
+            return super().paginate_queryset(queryset, request, view)
+        self.keyset_paginator = self.keyset_paginator_class()
+        return self.keyset_paginator.paginate_queryset(
+            queryset, request, view
+        )
+
+    def get_paginated_response(self, data):
+        if self.keyset_paginator is None:
+            return super().get_paginated_response(data)
+        return self.keyset_paginator.get_paginated_response(data)
@@ -1,7 +1,11 @@
-import base64
+import json
+
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
-from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import QueryDict
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from django.core.validators import (
     RegexValidator,
@@ -17,20 +21,107 @@ from recipes.models import (
     RecipeIngredients,
     Favorite,
     ShoppingCart,
-    ShortLink,
+)
+from recipes.images import variant_urls
+from recipes.services import update_recipe_in_shopping_carts
+from .cache import get_user_flags
+from .metrics import IMAGE_UPLOAD_BYTES
+from .uploads import (
+    check_pixels,
+    check_upload_size,
+    decode_base64_image,
+    strip_metadata,
 )
 
 MIN_COUNT = 1
 MAX_COUNT = 32000
+RECIPES_BATCH_LIMIT = 100
+VARIANTS_EXPAND = 'variants'
+
+
+def get_subscribed_ids(context):
+    """Id авторов, на которых подписан пользователь запроса.
+
+    В общем (кешируемом для всех) представлении подписок нет.
+    """
+    request = context.get('request')
+    if (
+        context.get('shared')
+        or request is None
+        or request.user.is_anonymous
+    ):
+        return frozenset()
+    return get_user_flags(request.user).subscriptions
 
 
 class Base64ImageField(serializers.ImageField):
+    """Изображение в виде data URI или файлом из multipart-запроса."""
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
-        return super().to_internal_value(data)
+            data = decode_base64_image(data)
+            IMAGE_UPLOAD_BYTES.labels('base64').observe(data.size)
+            self.register(data)
+        elif isinstance(data, UploadedFile):
+            IMAGE_UPLOAD_BYTES.labels('multipart').observe(data.size)
+            check_upload_size(data.size)
+        if isinstance(data, UploadedFile):
+            check_pixels(data)
+        file = super().to_internal_value(data)
+        return self.register(strip_metadata(file))
+
+    def register(self, file):
+        """Django закроет и удалит файл вместе с файлами запроса."""
+        request = self.context.get('request')
+        if request is not None:
+            request._request.FILES.appendlist(self.field_name, file)
+        return file
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии изображения.
+
+    Копии строятся в фоне после сохранения, сразу после загрузки
+    ссылки могут какое-то время отдавать 404.
+    """
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        urls = variant_urls(value.name)
+        request = self.context.get('request')
+        if request is None:
+            return urls
+        return {
+            variant: {
+                image_format: request.build_absolute_uri(url)
+                for image_format, url in formats.items()
+            }
+            for variant, formats in urls.items()
+        }
+
+
+def variants_requested(context):
+    request = context.get('request')
+    return request is not None and VARIANTS_EXPAND in (
+        request.query_params.get('expand', '').split(',')
+    )
+
+
+class ImageVariantsMixin:
+    """Поля ImageVariantsField отдаются только по ?expand=variants.
+
+    По умолчанию ответ совпадает с контрактом API, где у пользователя и
+    рецепта нет дополнительных полей.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not variants_requested(self.context):
+            for name, field in list(fields.items()):
+                if isinstance(field, ImageVariantsField):
+                    del fields[name]
+        return fields
 
 
 class UserAvatarSerializer(serializers.ModelSerializer):
@@ -43,8 +134,9 @@ class UserAvatarSerializer(serializers.ModelSerializer):
         )
 
 
-class UserCustomSerializer(UserSerializer):
+class UserCustomSerializer(ImageVariantsMixin, UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
+    avatar_variants = ImageVariantsField(source='avatar')
 
     class Meta:
         model = User
@@ -56,18 +148,17 @@ class UserCustomSerializer(UserSerializer):
             'last_name',
             'is_subscribed',
             'avatar',
+            'avatar_variants',
         )
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        return obj.following.filter(user=request.user, author=obj).exists()
+        return obj.id in get_subscribed_ids(self.context)
 
 
-class ShortRecipesSerializer(serializers.ModelSerializer):
+class ShortRecipesSerializer(ImageVariantsMixin, serializers.ModelSerializer):
 
     image = Base64ImageField(required=True)
+    image_variants = ImageVariantsField(source='image')
 
     class Meta:
         model = Recipes
@@ -75,6 +166,7 @@ class ShortRecipesSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_variants',
             'cooking_time',
         )
 
@@ -95,14 +187,21 @@ class SubscriptionSerializer(UserCustomSerializer):
             'recipes_count',
             'is_subscribed',
             'avatar',
+            'avatar_variants',
         )
 
     def get_recipes(self, obj):
-        recipes = obj.recipes.all()
-        serializers = ShortRecipesSerializer(recipes, many=True)
+        recipes = getattr(obj, 'recipes_preview', None)
+        if recipes is None:
+            recipes = obj.recipes.all()
+        serializers = ShortRecipesSerializer(
+            recipes, many=True, context=self.context
+        )
         return serializers.data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
 
@@ -181,18 +280,7 @@ class RecipesIngredientsSerializer(serializers.ModelSerializer):
         )
 
 
-class ShortLinksSerializer(serializers.ModelSerializer):
-    short_link = serializers.CharField(source='short_url')
-
-    class Meta:
-        model = ShortLink
-        fields = ('short_link',)
-
-    def to_representation(self, value):
-        return {'short-link': value.short_url}
-
-
-class RecipesListSerializer(serializers.ModelSerializer):
+class RecipesListSerializer(ImageVariantsMixin, serializers.ModelSerializer):
     author = UserCustomSerializer(
         default=serializers.CurrentUserDefault(),
         read_only=True
@@ -206,6 +294,7 @@ class RecipesListSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField()
+    image_variants = ImageVariantsField(source='image')
 
     class Meta:
         model = Recipes
@@ -214,6 +303,7 @@ class RecipesListSerializer(serializers.ModelSerializer):
             'author',
             'name',
             'image',
+            'image_variants',
             'text',
             'ingredients',
             'tags',
@@ -224,20 +314,36 @@ class RecipesListSerializer(serializers.ModelSerializer):
 
     def get_is_favorited(self, obj):
         request = self.context['request']
-        if request.user.is_anonymous:
+        if self.context.get('shared') or request.user.is_anonymous:
             return False
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         return obj.favorite.filter(user=request.user).exists()
 
     def get_is_in_shopping_cart(self, obj):
         request = self.context['request']
-        if request.user.is_anonymous:
+        if self.context.get('shared') or request.user.is_anonymous:
             return False
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         return obj.shopping_cart.filter(user=request.user).exists()
 
 
+def check_ids_exist(model, ids, label):
+    """Проверить одним запросом, что все id есть в базе."""
+    missing = set(ids) - set(
+        model.objects.filter(id__in=ids).values_list('id', flat=True)
+    )
+    if missing:
+        raise serializers.ValidationError(
+            f'{label} с id {", ".join(map(str, sorted(missing)))} '
+            f'не существуют.'
+        )
+
+
 class CreateIngredientSerializer(serializers.ModelSerializer):
 
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredients.objects.all())
+    id = serializers.IntegerField(min_value=1)
     amount = serializers.IntegerField(
         write_only=True,
         validators=[MinValueValidator(MIN_COUNT), MaxValueValidator(MAX_COUNT)]
@@ -251,13 +357,35 @@ class CreateIngredientSerializer(serializers.ModelSerializer):
         )
 
 
+def parse_multipart_recipe(data):
+    """Привести multipart-форму рецепта к виду JSON-запроса.
+
+    ingredients передается JSON-строкой, tags - повторяющимся полем или
+    JSON-списком, изображение - файлом.
+    """
+    parsed = {
+        key: data.get(key) for key in data
+        if key not in ('ingredients', 'tags')
+    }
+    try:
+        if 'ingredients' in data:
+            parsed['ingredients'] = json.loads(data['ingredients'])
+        if 'tags' in data:
+            tags = data.getlist('tags')
+            if len(tags) == 1 and tags[0].lstrip().startswith('['):
+                tags = json.loads(tags[0])
+            parsed['tags'] = tags
+    except ValueError:
+        raise serializers.ValidationError(
+            'Поля ingredients и tags должны быть корректным JSON.'
+        )
+    return parsed
+
+
 class RecipeCreateSerializer(serializers.ModelSerializer):
 
     ingredients = CreateIngredientSerializer(many=True, write_only=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tags.objects.all(),
-        many=True
-    )
+    tags = serializers.ListField(child=serializers.IntegerField(min_value=1))
     image = Base64ImageField()
     cooking_time = serializers.IntegerField(
         validators=(
@@ -277,6 +405,11 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             'cooking_time',
         )
 
+    def to_internal_value(self, data):
+        if isinstance(data, QueryDict):
+            data = parse_multipart_recipe(data)
+        return super().to_internal_value(data)
+
     def validate_ingredients(self, value):
         if not value:
             raise serializers.ValidationError(
@@ -289,6 +422,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                     'Два одинаковых ингредиента - один необходимо удалить'
                 )
             sum_ingredients.add(ingredient['id'])
+        check_ids_exist(Ingredients, sum_ingredients, 'Ингредиенты')
         return value
 
     def validate_tags(self, value):
@@ -303,16 +437,28 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                     'Два одинаковых тега - один необходимо удалить'
                 )
             sum_tags.add(tag_value)
+        check_ids_exist(Tags, sum_tags, 'Теги')
         return value
 
+    def validate(self, data):
+        """Ингредиенты и теги обязательны и при частичном обновлении."""
+        missing = {
+            field: 'Обязательное поле.'
+            for field in ('ingredients', 'tags') if field not in data
+        }
+        if missing:
+            raise serializers.ValidationError(missing)
+        return data
+
     def get_recipe_ingedients_create(self, obj, val_ingredients):
         list_ingred = [RecipeIngredients(
             recipes=obj,
             amount=ingredient['amount'],
-            ingredients=ingredient['id']
+            ingredients_id=ingredient['id']
         ) for ingredient in val_ingredients]
         return RecipeIngredients.objects.bulk_create(list_ingred)
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
@@ -321,23 +467,88 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         self.get_recipe_ingedients_create(recipe, ingredients)
         return recipe
 
+    def update_ingredients(self, instance, ingredients):
+        """Привести состав рецепта к ingredients, меняя только отличия."""
+        current = {
+            recipe_ingredient.ingredients_id: recipe_ingredient
+            for recipe_ingredient in instance.recipe_ingredients.all()
+        }
+        old_amounts = {
+            ingredient_id: recipe_ingredient.amount
+            for ingredient_id, recipe_ingredient in current.items()
+        }
+        new_amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        RecipeIngredients.objects.bulk_create(
+            RecipeIngredients(
+                recipes=instance, ingredients_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in new_amounts.items()
+            if ingredient_id not in current
+        )
+        changed = []
+        for ingredient_id, recipe_ingredient in current.items():
+            amount = new_amounts.get(ingredient_id)
+            if amount is not None and amount != recipe_ingredient.amount:
+                recipe_ingredient.amount = amount
+                changed.append(recipe_ingredient)
+        RecipeIngredients.objects.bulk_update(changed, ('amount',))
+        removed = current.keys() - new_amounts.keys()
+        if removed:
+            # Без сигналов: корзины меняются дельтой ниже, а не пересчетом.
+            RecipeIngredients.objects.filter(
+                recipes=instance, ingredients_id__in=removed
+            )._raw_delete(instance._state.db)
+        update_recipe_in_shopping_carts(instance, old_amounts, new_amounts)
+
+    def update_tags(self, instance, tags):
+        current = set(instance.tags.values_list('id', flat=True))
+        new = set(tags)
+        if current - new:
+            instance.tags.remove(*(current - new))
+        if new - current:
+            instance.tags.add(*(new - current))
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        instance.ingredients.clear()
-        self.get_recipe_ingedients_create(instance, ingredients)
-        instance.tags.clear()
-        instance.tags.set(tags)
+        """Обновить рецепт, меняя только отличия в ингредиентах и тегах."""
+        self.update_ingredients(instance, validated_data.pop('ingredients'))
+        self.update_tags(instance, validated_data.pop('tags'))
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
         request = self.context.get('request')
+        prefetch_related_objects(
+            [instance],
+            'tags',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredients.objects.select_related(
+                    'ingredients'
+                )
+            ),
+        )
         serializers = RecipesListSerializer(
             instance, context={'request': request}
         )
         return serializers.data
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=RECIPES_BATCH_LIMIT,
+        error_messages={
+            'max_length': (
+                f'Не больше {RECIPES_BATCH_LIMIT} рецептов за запрос.'
+            ),
+        },
+    )
+
+
 class FavoriteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Favorite
@@ -0,0 +1,106 @@
+"""Потоковая выгрузка списка покупок."""
+import csv
+from itertools import groupby
+from operator import itemgetter
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+TITLE = 'Список покупок:'
+CSV_HEADER = ('Ингредиент', 'Количество', 'Единица измерения')
+CSV_GROUPED_HEADER = ('Единица измерения', 'Ингредиент', 'Количество')
+PDF_FONT_NAME = 'ShoppingList'
+PDF_FONT_SIZE = 12
+PDF_LINE_HEIGHT = 18
+PDF_MARGIN = 50
+PDF_CHUNK_SIZE = 64 * 1024
+PDF_MAX_MEMORY_SIZE = 1024 * 1024
+
+
+class Echo:
+    """Псевдо-буфер для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def group_by_unit(rows):
+    """Группы (единица измерения, строки) из упорядоченных по ней строк."""
+    return groupby(rows, key=itemgetter(1))
+
+
+def render_txt(rows, group_by=None):
+    yield f'{TITLE}\n'
+    if group_by is None:
+        for i, (name, unit, amount) in enumerate(rows, 1):
+            yield f'{i}. {name} - {amount} {unit}\n'
+        return
+    for unit, group in group_by_unit(rows):
+        yield f'\n{unit}:\n'
+        for i, (name, _, amount) in enumerate(group, 1):
+            yield f'{i}. {name} - {amount}\n'
+
+
+def render_csv(rows, group_by=None):
+    """При группировке единица измерения идет первым столбцом."""
+    writer = csv.writer(Echo())
+    if group_by is None:
+        yield '\ufeff' + writer.writerow(CSV_HEADER)
+        for name, unit, amount in rows:
+            yield writer.writerow((name, amount, unit))
+        return
+    yield '\ufeff' + writer.writerow(CSV_GROUPED_HEADER)
+    for unit, group in group_by_unit(rows):
+        for name, _, amount in group:
+            yield writer.writerow((unit, name, amount))
+
+
+def get_pdf_font():
+    if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_FONT)
+        )
+    return PDF_FONT_NAME
+
+
+def render_pdf(rows, group_by=None):
+    """PDF собирается во временный файл и отдается частями.
+
+    Формат не допускает отдачу до записи таблицы ссылок в конце файла,
+    поэтому в памяти держится не больше PDF_MAX_MEMORY_SIZE байт.
+    """
+    font = get_pdf_font()
+    with SpooledTemporaryFile(max_size=PDF_MAX_MEMORY_SIZE) as buffer:
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        _, height = A4
+        y = height - PDF_MARGIN
+
+        def write_line(text):
+            nonlocal y
+            if y < PDF_MARGIN:
+                pdf.showPage()
+                y = height - PDF_MARGIN
+            pdf.setFont(font, PDF_FONT_SIZE)
+            pdf.drawString(PDF_MARGIN, y, text)
+            y -= PDF_LINE_HEIGHT
+
+        for text in render_txt(rows, group_by):
+            for line in text.splitlines():
+                write_line(line)
+        pdf.save()
+        buffer.seek(0)
+        yield from iter(lambda: buffer.read(PDF_CHUNK_SIZE), b'')
+
+
+EXPORT_FORMATS = {
+    'txt': (render_txt, 'text/plain; charset=utf-8', 'shopping_list.txt'),
+    'csv': (render_csv, 'text/csv; charset=utf-8', 'shopping_list.csv'),
+    'pdf': (render_pdf, 'application/pdf', 'shopping_list.pdf'),
+}
+GROUP_BY_FIELDS = {
+    'unit': 'ingredient__measurement_unit',
+}
@@ -0,0 +1,57 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from api.cache import COLLECTION, bump_versions, version_key
+from recipes.models import Ingredients, RecipeIngredients, Recipes, Tags
+from users.models import User
+
+
+def bump_on_commit(*keys):
+    transaction.on_commit(lambda: bump_versions(keys))
+
+
+@receiver((post_save, post_delete), sender=Recipes)
+def invalidate_recipe(sender, instance, **kwargs):
+    bump_on_commit(
+        version_key('recipe', instance.pk), version_key(COLLECTION)
+    )
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredients)
+def invalidate_recipe_ingredients(sender, instance, **kwargs):
+    bump_on_commit(version_key('recipe', instance.recipes_id))
+
+
+@receiver(m2m_changed, sender=Recipes.tags.through)
+def invalidate_recipe_tags(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        bump_on_commit(
+            version_key('recipe', instance.pk), version_key(COLLECTION)
+        )
+        return
+    bump_on_commit(
+        version_key('tag', instance.pk),
+        version_key(COLLECTION),
+        *(version_key('recipe', pk) for pk in pk_set or ())
+    )
+
+
+@receiver((post_save, post_delete), sender=Tags)
+def invalidate_tag(sender, instance, **kwargs):
+    bump_on_commit(version_key('tag', instance.pk), version_key('tags'))
+
+
+@receiver((post_save, post_delete), sender=Ingredients)
+def invalidate_ingredient(sender, instance, **kwargs):
+    bump_on_commit(
+        version_key('ingredient', instance.pk), version_key('ingredients')
+    )
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    bump_on_commit(version_key('user', instance.pk))
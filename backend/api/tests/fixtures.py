@@ -0,0 +1,51 @@
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredients, RecipeIngredients, Recipes, Tags
+from users.models import User
+
+IMAGE_NAME = 'recipes/images/test.jpg'
+
+
+def create_user(number):
+    return User.objects.create_user(
+        username=f'user{number}',
+        email=f'user{number}@example.com',
+        first_name='Имя',
+        last_name='Фамилия',
+        password='password',
+    )
+
+
+def get_client(user=None):
+    client = APIClient()
+    if user is not None:
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
+
+
+def create_recipes(author, count, ingredients=3):
+    tag = Tags.objects.create(name='Завтрак', slug='breakfast')
+    products = [
+        Ingredients.objects.create(
+            name=f'Продукт {number}', measurement_unit='г'
+        )
+        for number in range(ingredients)
+    ]
+    recipes = []
+    for number in range(count):
+        recipe = Recipes.objects.create(
+            author=author,
+            name=f'Рецепт {number}',
+            text='Описание',
+            image=IMAGE_NAME,
+            cooking_time=10,
+        )
+        recipe.tags.add(tag)
+        RecipeIngredients.objects.bulk_create(
+            RecipeIngredients(recipes=recipe, ingredients=product, amount=5)
+            for product in products
+        )
+        recipes.append(recipe)
+    return recipes
@@ -0,0 +1,70 @@
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import TestCase
+
+from api.tests.fixtures import create_recipes, create_user, get_client
+from recipes.models import ShoppingCart, ShoppingCartIngredient
+from recipes.services import link_recipes, unlink_recipes
+
+
+class BatchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(1)
+        cls.recipes = [recipe.pk for recipe in create_recipes(cls.user, 3)]
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.client = get_client(self.user)
+
+    def change(self, method, recipe_ids):
+        response = getattr(self.client, method)(
+            '/api/recipes/shopping_cart/', {'recipes': recipe_ids},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return [result['status'] for result in response.data['results']]
+
+    def get_totals(self):
+        return dict(
+            ShoppingCartIngredient.objects.filter(
+                user=self.user
+            ).values_list('ingredient__name', 'amount')
+        )
+
+    def test_statuses(self):
+        first, second, third = self.recipes
+        self.assertEqual(
+            self.change('post', [first, second]), ['created', 'created']
+        )
+        self.assertEqual(
+            self.change('post', [second, third, 999]),
+            ['exists', 'created', 'not_found']
+        )
+        self.assertEqual(
+            self.change('delete', [first, first, 999]),
+            ['deleted', 'not_found']
+        )
+        self.assertEqual(
+            self.change('delete', [first, second]), ['absent', 'deleted']
+        )
+
+    def test_totals_count_each_recipe_once(self):
+        link_recipes(ShoppingCart, self.user, self.recipes)
+        created, linked = link_recipes(ShoppingCart, self.user, self.recipes)
+        self.assertEqual((created, linked), (set(), set(self.recipes)))
+        self.assertEqual(set(self.get_totals().values()), {15})
+        unlink_recipes(ShoppingCart, self.user, self.recipes[:1])
+        self.assertEqual(
+            unlink_recipes(ShoppingCart, self.user, self.recipes[:1]), set()
+        )
+        self.assertEqual(set(self.get_totals().values()), {10})
+
+    def test_statuses_without_returning(self):
+        with mock.patch(
+            'recipes.services.supports_returning', return_value=False
+        ):
+            self.test_statuses()
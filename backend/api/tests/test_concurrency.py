@@ -0,0 +1,84 @@
+import threading
+from collections import Counter
+
+from django.core.cache import caches
+from django.db import connection
+from django.test import TransactionTestCase
+
+from api.tests.fixtures import create_recipes, create_user, get_client
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscriber
+
+THREADS = 8
+
+
+class ConcurrentLinkTests(TransactionTestCase):
+    """Одновременные одинаковые запросы меняют строку ровно один раз.
+
+    Потокам нужна общая база в отдельных соединениях, поэтому для
+    SQLite тестовая база должна быть файлом (TEST NAME в DATABASES).
+    """
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('База SQLite в памяти не видна другим потокам.')
+        for cache in caches.all():
+            cache.clear()
+        self.user = create_user(1)
+        self.author = create_user(2)
+        self.recipe = create_recipes(self.author, 1)[0]
+
+    def run_parallel(self, method, path):
+        """Статусы THREADS одновременных запросов, каждый в своем потоке."""
+        barrier = threading.Barrier(THREADS)
+        statuses = []
+        errors = []
+
+        def send():
+            client = get_client(self.user)
+            try:
+                barrier.wait()
+                statuses.append(getattr(client, method)(path).status_code)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=send) for _ in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return Counter(statuses)
+
+    def check(self, path, links, repeat_status, missing_status):
+        self.assertEqual(
+            self.run_parallel('post', path),
+            {201: 1, repeat_status: THREADS - 1}
+        )
+        self.assertEqual(links.count(), 1)
+        self.assertEqual(
+            self.run_parallel('delete', path),
+            {204: 1, missing_status: THREADS - 1}
+        )
+        self.assertEqual(links.count(), 0)
+
+    def test_favorite(self):
+        self.check(
+            f'/api/recipes/{self.recipe.pk}/favorite/',
+            Favorite.objects.filter(user=self.user), 204, 404
+        )
+
+    def test_shopping_cart(self):
+        self.check(
+            f'/api/recipes/{self.recipe.pk}/shopping_cart/',
+            ShoppingCart.objects.filter(user=self.user), 204, 404
+        )
+        self.assertFalse(self.user.shopping_cart_ingredients.exists())
+
+    def test_subscribe(self):
+        self.check(
+            f'/api/users/{self.author.pk}/subscribe/',
+            Subscriber.objects.filter(user=self.user), 400, 400
+        )
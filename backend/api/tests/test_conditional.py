@@ -0,0 +1,71 @@
+from django.core.cache import caches
+from django.test import TestCase
+
+from api.tests.fixtures import create_recipes, create_user, get_client
+from recipes.models import RecipeIngredients, Tags
+
+
+class ETagTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(1)
+        cls.recipe = create_recipes(cls.user, 1)[0]
+
+    def setUp(self):
+        self.clear_caches()
+        self.client = get_client(self.user)
+
+    @staticmethod
+    def clear_caches():
+        for cache in caches.all():
+            cache.clear()
+
+    def assert_not_modified(self, path):
+        etag = self.client.get(path)['ETag']
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        return etag
+
+    def test_not_modified(self):
+        for path in (
+            '/api/tags/',
+            f'/api/tags/{self.recipe.tags.get().pk}/',
+            f'/api/recipes/{self.recipe.pk}/',
+        ):
+            with self.subTest(path=path):
+                self.assert_not_modified(path)
+
+    def test_tag_etag_survives_cache_reset(self):
+        etag = self.assert_not_modified('/api/tags/')
+        self.clear_caches()
+        Tags.objects.update(name='Ужин')
+        self.assertNotEqual(self.client.get('/api/tags/')['ETag'], etag)
+
+    def test_recipe_etag_follows_user_flags(self):
+        path = f'/api/recipes/{self.recipe.pk}/'
+        etag = self.assert_not_modified(path)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'{path}favorite/')
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['is_favorited'])
+
+    def test_recipe_not_modified_without_serialization(self):
+        path = f'/api/recipes/{self.recipe.pk}/'
+        etag = self.client.get(path)['ETag']
+        with self.assertNumQueries(2):
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_recipe_etag_follows_ingredients_and_cache_reset(self):
+        path = f'/api/recipes/{self.recipe.pk}/'
+        etag = self.assert_not_modified(path)
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeIngredients.objects.filter(
+                recipes=self.recipe
+            ).first().save()
+        changed = self.client.get(path)['ETag']
+        self.assertNotEqual(changed, etag)
+        self.clear_caches()
+        self.assertNotIn(self.client.get(path)['ETag'], (etag, changed))
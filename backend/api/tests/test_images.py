@@ -0,0 +1,157 @@
+import os
+import tempfile
+import time
+from base64 import b64encode
+from io import BytesIO, StringIO
+
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from PIL import Image, PngImagePlugin
+from rest_framework.exceptions import ValidationError
+
+from api.serializers import Base64ImageField
+from api.tests.fixtures import create_recipes, create_user, get_client
+
+ORIENTATION = 0x0112
+GPS_INFO = 0x8825
+
+
+def make_exif():
+    exif = Image.Exif()
+    exif[ORIENTATION] = 6
+    exif[GPS_INFO] = {1: 'N', 2: (55.0, 45.0, 0.0)}
+    return exif
+
+
+def encode(image_format, image, **options):
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def data_uri(content, image_format):
+    encoded = b64encode(content).decode()
+    return f'data:image/{image_format.lower()};base64,{encoded}'
+
+
+class StripMetadataTests(SimpleTestCase):
+
+    def upload(self, content, image_format):
+        file = Base64ImageField().to_internal_value(
+            data_uri(content, image_format)
+        )
+        return Image.open(BytesIO(file.read()))
+
+    def assert_stripped(self, image_format, source, **options):
+        content = encode(image_format, source, exif=make_exif(), **options)
+        image = self.upload(content, image_format)
+        self.assertEqual(image.format, image_format)
+        self.assertEqual(dict(image.getexif()), {ORIENTATION: 6})
+        self.assertEqual(
+            image.tobytes(), Image.open(BytesIO(content)).tobytes()
+        )
+        return image
+
+    def test_jpeg(self):
+        image = self.assert_stripped(
+            'JPEG', Image.effect_noise((40, 20), 50).convert('RGB'),
+            comment=b'secret',
+        )
+        self.assertEqual(image.size, (40, 20))
+        self.assertNotIn('comment', image.info)
+
+    def test_png(self):
+        text = PngImagePlugin.PngInfo()
+        text.add_text('Author', 'Имя')
+        image = self.assert_stripped(
+            'PNG', Image.new('RGBA', (3, 2), 'red'), pnginfo=text
+        )
+        self.assertNotIn('Author', image.info)
+
+    def test_webp(self):
+        image = self.assert_stripped(
+            'WEBP', Image.new('RGB', (3, 2), 'red'), lossless=True
+        )
+        self.assertNotIn('xmp', image.info)
+
+    def test_without_orientation(self):
+        content = encode('PNG', Image.new('RGB', (1, 1)))
+        self.assertEqual(dict(self.upload(content, 'PNG').getexif()), {})
+
+    def test_other_formats_rejected(self):
+        with self.assertRaises(ValidationError):
+            self.upload(encode('GIF', Image.new('P', (1, 1))), 'GIF')
+
+    @override_settings(IMAGE_MAX_PIXELS=100)
+    def test_pixel_limit(self):
+        self.upload(encode('PNG', Image.new('RGB', (10, 10))), 'PNG')
+        with self.assertRaises(ValidationError):
+            self.upload(encode('PNG', Image.new('RGB', (101, 1))), 'PNG')
+
+
+class ImageVariantsExpandTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(1)
+        cls.recipe = create_recipes(cls.user, 1)[0]
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.client = get_client(self.user)
+
+    def test_variants_hidden_by_default(self):
+        for path in ('/api/recipes/', f'/api/recipes/{self.recipe.pk}/'):
+            with self.subTest(path=path):
+                response = self.client.get(path)
+                data = response.data
+                recipe = data['results'][0] if 'results' in data else data
+                self.assertNotIn('image_variants', recipe)
+                self.assertNotIn('avatar_variants', recipe['author'])
+
+    def test_variants_expanded(self):
+        for path in ('/api/recipes/', f'/api/recipes/{self.recipe.pk}/'):
+            with self.subTest(path=path):
+                response = self.client.get(path, {'expand': 'variants'})
+                data = response.data
+                recipe = data['results'][0] if 'results' in data else data
+                self.assertIn('image_variants', recipe)
+                self.assertIn('avatar_variants', recipe['author'])
+
+
+class CollectMediaTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(MEDIA_ROOT=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def save_old(self, content):
+        name = default_storage.save(
+            'recipes/images/a.jpg', ContentFile(content)
+        )
+        old = time.time() - 2 * 60 * 60
+        os.utime(default_storage.path(name), (old, old))
+        return name
+
+    def test_unreferenced_old_file_removed(self):
+        name = self.save_old(b'first')
+        call_command('collect_media', stdout=StringIO())
+        self.assertFalse(default_storage.exists(name))
+
+    def test_reupload_protects_file(self):
+        name = self.save_old(b'second')
+        self.assertEqual(
+            default_storage.save(
+                'recipes/images/b.jpg', ContentFile(b'second')
+            ),
+            name
+        )
+        call_command('collect_media', stdout=StringIO())
+        self.assertTrue(default_storage.exists(name))
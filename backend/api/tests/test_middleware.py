@@ -0,0 +1,49 @@
+import json
+
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+from api.tests.fixtures import create_recipes, create_user, get_client
+from recipes.models import ShoppingCart
+
+
+@override_settings(SERVER_TIMING=False, PERFORMANCE_LOG_SAMPLE_RATE=1)
+class PerformanceMiddlewareTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(1)
+        cls.recipe = create_recipes(cls.user, 1)[0]
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.recipe)
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def test_server_timing_only_for_staff(self):
+        with self.assertLogs('api.performance'):
+            response = get_client(self.user).get('/api/recipes/')
+            self.assertNotIn('Server-Timing', response)
+            self.user.is_staff = True
+            self.user.save()
+            response = get_client(self.user).get('/api/recipes/')
+        self.assertIn('serialize;dur=', response['Server-Timing'])
+
+    def test_streaming_response_measured_after_reading(self):
+        client = get_client(self.user)
+        with self.assertLogs('api.performance') as logs:
+            response = client.get('/api/recipes/download_shopping_cart/')
+            self.assertEqual(logs.output, [])
+            b''.join(response.streaming_content)
+            response.close()
+        self.assertNotIn('Server-Timing', response)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertTrue(record['streaming'])
+        self.assertGreaterEqual(record['db_queries'], 2)
+
+    def test_serialization_timed_once_per_response(self):
+        with self.assertLogs('api.performance') as logs:
+            get_client(self.user).get('/api/recipes/')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertGreater(record['serialize_ms'], 0)
+        self.assertLessEqual(record['serialize_ms'], record['view_ms'])
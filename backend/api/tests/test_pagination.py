@@ -0,0 +1,60 @@
+import json
+from base64 import urlsafe_b64encode
+
+from django.core.cache import caches
+from django.test import TestCase
+
+from api.tests.fixtures import create_recipes, create_user, get_client
+
+
+def encode_cursor(reverse, values):
+    return urlsafe_b64encode(json.dumps([reverse, values]).encode()).decode()
+
+
+class CursorTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_recipes(create_user(1), 3)
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.client = get_client()
+
+    def get_page(self, cursor):
+        return self.client.get('/api/recipes/', {'cursor': cursor})
+
+    def test_first_page_and_next_cursor(self):
+        response = self.client.get('/api/recipes/', {'cursor': '', 'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+        next_page = self.client.get(response.data['next'])
+        self.assertEqual(next_page.status_code, 200)
+        self.assertEqual(len(next_page.data['results']), 1)
+
+    def test_invalid_date_in_cursor(self):
+        response = self.get_page(encode_cursor(0, ['garbage', 1]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_invalid_id_in_cursor(self):
+        for value in ('abc', 10 ** 30, [1], None):
+            with self.subTest(value=value):
+                response = self.get_page(
+                    encode_cursor(0, ['2024-01-01T00:00:00+00:00', value])
+                )
+                self.assertEqual(response.status_code, 404)
+
+    def test_wrong_type_of_date_in_cursor(self):
+        response = self.get_page(encode_cursor(0, [{}, 1]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_not_base64_cursor(self):
+        self.assertEqual(self.get_page('!!!').status_code, 404)
+
+    def test_search_with_cursor_rejected(self):
+        response = self.client.get(
+            '/api/recipes/', {'cursor': '', 'search': 'Рецепт'}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cursor', response.data)
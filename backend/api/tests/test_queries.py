@@ -0,0 +1,37 @@
+from django.core.cache import caches
+from django.test import TestCase
+
+from api.tests.fixtures import create_recipes, create_user, get_client
+
+LIMITS = (6, 60)
+ANONYMOUS_QUERIES = 4
+AUTHENTICATED_QUERIES = 8
+
+
+class RecipeListQueryTests(TestCase):
+    """Число SQL-запросов списка рецептов не зависит от размера страницы.
+
+    Для анонима - счетчик, страница и две предвыборки (теги и
+    ингредиенты). Пользователю добавляются токен и три запроса за
+    флагами избранного, корзины и подписок.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(1)
+        create_recipes(cls.user, max(LIMITS) + 1)
+
+    def check_queries(self, client, expected):
+        for limit in LIMITS:
+            with self.subTest(limit=limit):
+                for cache in caches.all():
+                    cache.clear()
+                with self.assertNumQueries(expected):
+                    response = client.get('/api/recipes/', {'limit': limit})
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_anonymous(self):
+        self.check_queries(get_client(), ANONYMOUS_QUERIES)
+
+    def test_authenticated(self):
+        self.check_queries(get_client(self.user), AUTHENTICATED_QUERIES)
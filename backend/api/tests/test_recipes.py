@@ -0,0 +1,50 @@
+from django.core.cache import caches
+from django.test import TestCase
+
+from api.tests.fixtures import create_recipes, create_user, get_client
+from recipes.models import Ingredients
+
+
+class RecipeUpdateTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(1)
+        cls.recipe = create_recipes(cls.user, 1)[0]
+        cls.tag = cls.recipe.tags.get()
+        cls.ingredient = Ingredients.objects.first()
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.client = get_client(self.user)
+        self.path = f'/api/recipes/{self.recipe.pk}/'
+
+    def test_ingredients_and_tags_required(self):
+        data = {
+            'ingredients': [{'id': self.ingredient.pk, 'amount': 7}],
+            'tags': [self.tag.pk],
+        }
+        for field in data:
+            with self.subTest(missing=field):
+                response = self.client.patch(
+                    self.path,
+                    {key: value for key, value in data.items()
+                     if key != field},
+                    format='json',
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(field, response.data)
+
+    def test_update_by_difference(self):
+        response = self.client.patch(self.path, {
+            'ingredients': [{'id': self.ingredient.pk, 'amount': 7}],
+            'tags': [self.tag.pk],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(self.recipe.recipe_ingredients.values_list(
+                'ingredients_id', 'amount'
+            )),
+            [(self.ingredient.pk, 7)]
+        )
@@ -0,0 +1,91 @@
+from django.core.cache import caches
+from django.test import Client, TestCase
+
+from api.tests.fixtures import create_recipes, create_user, get_client
+from recipes.models import RecipeIngredients, Recipes, ShoppingCart
+from recipes.services import (
+    calculate_shopping_cart_totals,
+    get_shopping_cart_totals,
+)
+from users.models import User
+
+
+class ShoppingCartTotalsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user(1)
+        cls.user = create_user(2)
+        cls.recipes = create_recipes(cls.author, 2)
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def assertTotalsConsistent(self):
+        self.assertEqual(
+            get_shopping_cart_totals(), calculate_shopping_cart_totals()
+        )
+
+    def get_amounts(self):
+        return set(get_shopping_cart_totals()[self.user.pk].values())
+
+    def add_to_cart(self, recipe):
+        with self.captureOnCommitCallbacks(execute=True):
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+
+    def test_orm_changes(self):
+        first, second = self.recipes
+        self.add_to_cart(first)
+        self.add_to_cart(second)
+        self.assertEqual(self.get_amounts(), {10})
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeIngredients.objects.filter(recipes=first).first().delete()
+        self.assertTotalsConsistent()
+        with self.captureOnCommitCallbacks(execute=True):
+            ShoppingCart.objects.filter(recipe=second).delete()
+        self.assertTotalsConsistent()
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipes.objects.filter(pk=first.pk).delete()
+        self.assertTotalsConsistent()
+        self.assertEqual(get_shopping_cart_totals(), {})
+
+    def test_admin_delete_action(self):
+        first, second = self.recipes
+        self.add_to_cart(first)
+        self.add_to_cart(second)
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='password'
+        )
+        client = Client()
+        client.force_login(admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/admin/recipes/recipes/', {
+                'action': 'delete_selected',
+                '_selected_action': [first.pk],
+                'post': 'yes',
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Recipes.objects.filter(pk=first.pk).exists())
+        self.assertTotalsConsistent()
+        self.assertEqual(self.get_amounts(), {5})
+
+    def test_api_paths_do_not_double_count(self):
+        first, second = self.recipes
+        client = get_client(self.user)
+        for recipe in self.recipes:
+            with self.captureOnCommitCallbacks(execute=True):
+                client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.delete(
+                f'/api/recipes/{first.pk}/shopping_cart/'
+            )
+        self.assertEqual(response.status_code, 204)
+        self.assertTotalsConsistent()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = get_client(self.author).delete(
+                f'/api/recipes/{second.pk}/'
+            )
+        self.assertEqual(response.status_code, 204)
+        self.assertTotalsConsistent()
+        self.assertEqual(get_shopping_cart_totals(), {})
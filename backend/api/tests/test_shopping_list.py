@@ -0,0 +1,26 @@
+from django.test import SimpleTestCase
+
+from api.shopping_list import render_csv, render_txt
+
+ROWS = (('Мука', 'г', 500), ('Сахар', 'г', 100), ('Молоко', 'мл', 200))
+
+
+class ShoppingListTests(SimpleTestCase):
+
+    def test_csv(self):
+        self.assertEqual(''.join(render_csv(iter(ROWS))), (
+            '\ufeffИнгредиент,Количество,Единица измерения\r\n'
+            'Мука,500,г\r\nСахар,100,г\r\nМолоко,200,мл\r\n'
+        ))
+
+    def test_csv_grouped_by_unit(self):
+        self.assertEqual(''.join(render_csv(iter(ROWS), 'unit')), (
+            '\ufeffЕдиница измерения,Ингредиент,Количество\r\n'
+            'г,Мука,500\r\nг,Сахар,100\r\nмл,Молоко,200\r\n'
+        ))
+
+    def test_txt_grouped_by_unit(self):
+        self.assertEqual(''.join(render_txt(iter(ROWS), 'unit')), (
+            'Список покупок:\n\nг:\n1. Мука - 500\n2. Сахар - 100\n'
+            '\nмл:\n1. Молоко - 200\n'
+        ))
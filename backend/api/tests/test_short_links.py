@@ -0,0 +1,37 @@
+from django.test import TestCase
+
+from api.tests.fixtures import create_recipes, create_user, get_client
+from recipes.models import ShortLink
+from recipes.short_links import resolve_legacy_link
+
+
+class ShortLinkTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipe = create_recipes(create_user(1), 1)[0]
+
+    def setUp(self):
+        resolve_legacy_link.cache_clear()
+
+    def test_canonical_link_is_not_stored(self):
+        response = get_client().get(f'/api/recipes/{self.recipe.pk}/get-link/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(ShortLink.objects.exists())
+        short_link = response.data['short-link']
+        response = self.client.get(f'{short_link}/')
+        self.assertRedirects(
+            response, f'/recipes/{self.recipe.pk}',
+            fetch_redirect_response=False
+        )
+
+    def test_legacy_link(self):
+        ShortLink.objects.create(
+            origin_url=f'http://testserver/api/recipes/{self.recipe.pk}/',
+            short_url='/s/AbCdEfG',
+            code='AbCdEfG',
+        )
+        response = self.client.get('/s/AbCdEfG/')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(f'/recipes/{self.recipe.pk}', response.url)
+        self.assertEqual(self.client.get('/s/ZzZzZzZ/').status_code, 404)
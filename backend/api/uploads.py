@@ -0,0 +1,271 @@
+"""Прием изображений в base64 и multipart без лишних копий в памяти.
+
+Метаданные (EXIF с координатами съемки, XMP, комментарии) вырезаются
+из файла без декодирования: сегменты JPEG и чанки PNG и WebP
+копируются частями во временный файл, сжатые данные не меняются.
+Из EXIF остается только тег Orientation.
+"""
+import binascii
+import struct
+import zlib
+from base64 import b64decode
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import (
+    InMemoryUploadedFile,
+    TemporaryUploadedFile,
+)
+from PIL import Image, UnidentifiedImageError
+from rest_framework import serializers
+
+BASE64_MARKER = ';base64,'
+CHUNK_SIZE = 64 * 1024 * 4
+MEGABYTE = 1024 * 1024
+ORIENTATION = 0x0112
+EXIF_HEADER = b'Exif\x00\x00'
+JPEG_DROPPED_MARKERS = {
+    0xE1,  # APP1: EXIF и XMP
+    0xED,  # APP13: IPTC
+    0xFE,  # COM
+}
+JPEG_STANDALONE_MARKERS = {0x01, *range(0xD0, 0xD8)}
+JPEG_SOS = 0xDA
+JPEG_EOI = 0xD9
+JPEG_APP0 = 0xE0
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_DROPPED_CHUNKS = {b'eXIf', b'tEXt', b'zTXt', b'iTXt', b'tIME'}
+WEBP_DROPPED_CHUNKS = {b'EXIF', b'XMP '}
+WEBP_EXIF_FLAG = 0x08
+WEBP_XMP_FLAG = 0x04
+
+
+def check_upload_size(size):
+    if size > settings.IMAGE_UPLOAD_MAX_SIZE:
+        raise serializers.ValidationError(
+            'Размер изображения не должен превышать '
+            f'{settings.IMAGE_UPLOAD_MAX_SIZE / MEGABYTE:.1f} МБ.'
+        )
+
+
+def check_pixels(file):
+    """Проверить число пикселей по заголовку, не декодируя изображение.
+
+    Единственное ограничение размеров изображения - IMAGE_MAX_PIXELS.
+    """
+    position = file.tell()
+    try:
+        with Image.open(file) as image:
+            width, height = image.size
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise serializers.ValidationError(
+            'Загрузите корректное изображение.'
+        )
+    finally:
+        file.seek(position)
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise serializers.ValidationError(
+            'Изображение не должно содержать больше '
+            f'{settings.IMAGE_MAX_PIXELS} пикселей.'
+        )
+
+
+def new_upload(name, content_type, size):
+    """Пустой загруженный файл: в памяти или, если он крупный, на диске."""
+    if size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+        return TemporaryUploadedFile(name, content_type, 0, None)
+    return InMemoryUploadedFile(BytesIO(), None, name, content_type, 0, None)
+
+
+def decode_base64_image(data):
+    """Раскодировать data URI частями в загруженный файл.
+
+    Размер проверяется по длине строки до декодирования. Небольшие
+    изображения собираются в памяти, крупнее FILE_UPLOAD_MAX_MEMORY_SIZE
+    - сразу во временном файле на диске, откуда их читает Pillow.
+    """
+    marker = data.find(BASE64_MARKER)
+    if marker == -1:
+        raise serializers.ValidationError('Некорректный формат изображения.')
+    content_type = data[len('data:'):marker]
+    extension = content_type.split('/')[-1]
+    start = marker + len(BASE64_MARKER)
+    estimated_size = (len(data) - start) * 3 // 4
+    check_upload_size(estimated_size)
+    file = new_upload(f'image.{extension}', content_type, estimated_size)
+    carry = ''
+    size = 0
+    try:
+        for position in range(start, len(data), CHUNK_SIZE):
+            chunk = ''.join(
+                (carry + data[position:position + CHUNK_SIZE]).split()
+            )
+            cut = len(chunk) - len(chunk) % 4
+            carry = chunk[cut:]
+            decoded = b64decode(chunk[:cut], validate=True)
+            size += len(decoded)
+            file.write(decoded)
+        if carry:
+            raise binascii.Error
+    except (binascii.Error, ValueError):
+        file.close()
+        raise serializers.ValidationError('Некорректные данные base64.')
+    check_upload_size(size)
+    file.size = size
+    file.seek(0)
+    return file
+
+
+def read_exactly(file, size):
+    data = file.read(size)
+    if len(data) != size:
+        raise EOFError
+    return data
+
+
+def copy_bytes(source, target, size):
+    while size > 0:
+        chunk = read_exactly(source, min(size, CHUNK_SIZE))
+        target.write(chunk)
+        size -= len(chunk)
+
+
+def copy_rest(source, target):
+    for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+        target.write(chunk)
+
+
+def orientation_exif(orientation):
+    """EXIF (данные TIFF без заголовка Exif) только с Orientation."""
+    if orientation in (None, 1):
+        return None
+    exif = Image.Exif()
+    exif[ORIENTATION] = orientation
+    return exif.tobytes()[len(EXIF_HEADER):]
+
+
+def strip_jpeg(source, target, exif):
+    target.write(read_exactly(source, 2))
+    while True:
+        if read_exactly(source, 1) != b'\xff':
+            raise ValueError('Нет маркера сегмента JPEG.')
+        marker = 0xFF
+        while marker == 0xFF:
+            marker = read_exactly(source, 1)[0]
+        if marker in JPEG_STANDALONE_MARKERS or marker == JPEG_EOI:
+            target.write(bytes((0xFF, marker)))
+            if marker == JPEG_EOI:
+                return
+            continue
+        if exif is not None and marker != JPEG_APP0:
+            payload = EXIF_HEADER + exif
+            target.write(struct.pack('>BBH', 0xFF, 0xE1, len(payload) + 2))
+            target.write(payload)
+            exif = None
+        if marker == JPEG_SOS:
+            target.write(bytes((0xFF, marker)))
+            copy_rest(source, target)
+            return
+        length = struct.unpack('>H', read_exactly(source, 2))[0]
+        if marker in JPEG_DROPPED_MARKERS:
+            source.seek(length - 2, 1)
+            continue
+        target.write(struct.pack('>BBH', 0xFF, marker, length))
+        copy_bytes(source, target, length - 2)
+
+
+def png_chunk(chunk_type, data):
+    return (
+        struct.pack('>I', len(data)) + chunk_type + data
+        + struct.pack('>I', zlib.crc32(chunk_type + data))
+    )
+
+
+def strip_png(source, target, exif):
+    target.write(read_exactly(source, len(PNG_SIGNATURE)))
+    while True:
+        length, chunk_type = struct.unpack('>I4s', read_exactly(source, 8))
+        if chunk_type in PNG_DROPPED_CHUNKS:
+            source.seek(length + 4, 1)
+            continue
+        if chunk_type == b'IDAT' and exif is not None:
+            target.write(png_chunk(b'eXIf', exif))
+            exif = None
+        target.write(struct.pack('>I4s', length, chunk_type))
+        copy_bytes(source, target, length + 4)
+        if chunk_type == b'IEND':
+            return
+
+
+def strip_webp(source, target, exif):
+    """Чанки WebP без EXIF и XMP; EXIF возможен только при VP8X."""
+    header = read_exactly(source, 12)
+    riff_size = struct.unpack('<I', header[4:8])[0]
+    end = riff_size + 8
+    target.write(header)
+    flags_position = None
+    while source.tell() < end:
+        chunk_type, size = struct.unpack('<4sI', read_exactly(source, 8))
+        padded = size + size % 2
+        if chunk_type in WEBP_DROPPED_CHUNKS:
+            source.seek(padded, 1)
+            continue
+        target.write(struct.pack('<4sI', chunk_type, size))
+        if chunk_type == b'VP8X':
+            flags_position = target.tell()
+        copy_bytes(source, target, padded)
+    flags = WEBP_EXIF_FLAG if exif is not None else 0
+    if flags_position is not None:
+        if exif is not None:
+            target.write(struct.pack('<4sI', b'EXIF', len(exif)))
+            target.write(exif + b'\x00' * (len(exif) % 2))
+        target.seek(flags_position)
+        current = read_exactly(target, 1)[0]
+        target.seek(flags_position)
+        target.write(bytes((
+            current & ~(WEBP_EXIF_FLAG | WEBP_XMP_FLAG) | flags,
+        )))
+    target.seek(0, 2)
+    size = target.tell()
+    target.seek(4)
+    target.write(struct.pack('<I', size - 8))
+
+
+STRIPPERS = {
+    'JPEG': strip_jpeg,
+    'PNG': strip_png,
+    'WEBP': strip_webp,
+}
+
+
+def strip_metadata(file):
+    """Копия загруженного изображения без метаданных.
+
+    Принимаются JPEG, PNG и WebP. Копия пишется частями в файл того же
+    типа, что и загрузки (крупные - на диск), поэтому изображение не
+    декодируется и не держится в памяти целиком.
+    """
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            image_format = image.format
+            orientation = image.getexif().get(ORIENTATION)
+    except (UnidentifiedImageError, OSError):
+        raise serializers.ValidationError('Загрузите корректное изображение.')
+    if image_format not in STRIPPERS:
+        raise serializers.ValidationError(
+            'Поддерживаются изображения JPEG, PNG и WebP.'
+        )
+    file.seek(0)
+    stripped = new_upload(
+        file.name, getattr(file, 'content_type', None), file.size
+    )
+    try:
+        STRIPPERS[image_format](file, stripped, orientation_exif(orientation))
+    except (EOFError, ValueError, struct.error):
+        stripped.close()
+        raise serializers.ValidationError('Загрузите корректное изображение.')
+    stripped.seek(0, 2)
+    stripped.size = stripped.tell()
+    stripped.seek(0)
+    return stripped
@@ -1,29 +1,46 @@
-import random
-from string import ascii_letters
-
 from djoser import views as djoser_views
 from djoser.serializers import SetPasswordSerializer
 from django.shortcuts import get_object_or_404, redirect
-from django.contrib.sites.shortcuts import get_current_site
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseForbidden,
+    StreamingHttpResponse,
+)
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Sum
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Prefetch, Subquery
 from rest_framework import viewsets
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import action, api_view
+from rest_framework.exceptions import NotFound
 
 from users.models import User, Subscriber
 from recipes.models import (
     Recipes,
     Tags,
     Ingredients,
-    ShortLink,
     Favorite,
     ShoppingCart,
     RecipeIngredients
 )
+from recipes.ingredient_index import ingredient_index, search_similar
+from recipes.short_links import (
+    decode_recipe_id,
+    encode_recipe_id,
+    get_frontend_path,
+    is_legacy_code,
+    resolve_legacy_link,
+)
+from recipes.services import (
+    add_to_shopping_cart_totals,
+    insert_unique,
+    link_recipes,
+    unlink_recipes,
+)
 from .serializers import (
     RecipeCreateSerializer,
     ShortRecipesSerializer,
@@ -36,21 +53,81 @@ from .serializers import (
     IngredientsSerializer,
     FavoriteSerializer,
     ShoppingCartSerializer,
-    ShortLinksSerializer,
-
+    RecipeIdsSerializer,
+)
+from .cache import (
+    COLLECTION,
+    get_user_flags,
+    invalidate_user_flags,
+    overlay_user_flags,
+    recipes_cache,
+    version_key,
+)
+from .conditional import (
+    conditional_response,
+    ingredients_etag,
+    recipe_etag,
+    tags_etag,
 )
 from .filters import IngredientFilter, TagsFilter
-from .paginators import LimitPageNumberPaginator
+from .metrics import (
+    SHORT_LINK_REDIRECTS,
+    is_allowed,
+    render_metrics,
+    time_serialization,
+)
+from .shopping_list import EXPORT_FORMATS, GROUP_BY_FIELDS
+from .paginators import FeedPaginator
 from .permissions import IsAuthorOrAdminOrReadOnly
 
-SIZE_SHORT_URL = 7
+SHOPPING_LIST_CHUNK_SIZE = 500
+INGREDIENT_SEARCH_LIMIT = 20
+USER_FILTERS = ('is_favorited', 'is_in_shopping_cart')
+
+
+def parse_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise NotFound()
+
+
+class TimedSerializerMixin:
+    """Время построения ответа сериализатором попадает в метрики запроса."""
 
+    def get_serializer(self, *args, **kwargs):
+        return time_serialization(super().get_serializer(*args, **kwargs))
 
-class UserViewSet(djoser_views.UserViewSet):
+
+class UserViewSet(TimedSerializerMixin, djoser_views.UserViewSet):
     queryset = User.objects.all()
-    pagination_class = LimitPageNumberPaginator
+    pagination_class = FeedPaginator
+    keyset_ordering = ('id',)
     permission_classes = (IsAuthenticated,)
 
+    def get_recipes_limit(self):
+        try:
+            recipes_limit = int(self.request.query_params['recipes_limit'])
+        except (KeyError, ValueError):
+            return None
+        return recipes_limit if recipes_limit >= 0 else None
+
+    def get_subscriptions_queryset(self, queryset):
+        """Авторы с числом рецептов и ограниченным превью рецептов."""
+        recipes = Recipes.objects.defer('search_vector')
+        recipes_limit = self.get_recipes_limit()
+        if recipes_limit is not None:
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipes.objects.filter(
+                    author=OuterRef('author')
+                ).values('pk')[:recipes_limit]
+            ))
+        return queryset.annotate(
+            recipes_count=Count('recipes')
+        ).order_by(*User._meta.ordering).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='recipes_preview')
+        )
+
     def get_permissions(self):
         if self.action in ('list', 'retrieve', 'create',):
             return (AllowAny(),)
@@ -87,7 +164,10 @@ class UserViewSet(djoser_views.UserViewSet):
             serializer.save()
             return Response(serializer.data, status=status.HTTP_200_OK)
         if request.method == 'DELETE':
-            user.avatar.delete()
+            # Файл может быть общим с другими объектами, его удалит
+            # collect_media, когда ссылок не останется.
+            user.avatar = None
+            user.save(update_fields=['avatar'])
             return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -98,29 +178,33 @@ class UserViewSet(djoser_views.UserViewSet):
     )
     def subcription(self, request, id=None):
         user = self.request.user
-        author = get_object_or_404(User, id=id)
-        instance = user.follower.filter(author=author)
+        id = parse_id(id)
         if request.method == 'POST':
-            if instance.exists():
+            author = get_object_or_404(
+                self.get_subscriptions_queryset(User.objects.all()), id=id
+            )
+            if insert_unique(
+                Subscriber, 'author', user=user.pk, author=author.pk
+            ) is None:
                 return Response(
                     'Подписка на пользователя есть',
                     status=status.HTTP_400_BAD_REQUEST
                 )
-
-            Subscriber.objects.create(user=user, author=author)
-            serializer = SubscriptionSerializer(author)
+            invalidate_user_flags(user)
+            serializer = self.get_serializer(author)
             return Response(
                 serializer.data,
                 status=status.HTTP_201_CREATED
             )
-        if request.method == 'DELETE':
-            if instance.exists():
-                instance.delete()
-                return Response(
-                    'Подписка удалена',
-                    status=status.HTTP_204_NO_CONTENT
-                )
+        deleted, _ = user.follower.filter(author_id=id).delete()
+        if not deleted:
+            get_object_or_404(User, id=id)
             return Response('Подписки нет', status=status.HTTP_400_BAD_REQUEST)
+        invalidate_user_flags(user)
+        return Response(
+            'Подписка удалена',
+            status=status.HTTP_204_NO_CONTENT
+        )
 
     @action(
         detail=False,
@@ -129,36 +213,145 @@ class UserViewSet(djoser_views.UserViewSet):
     )
     def subscriptions(self, request):
         user = self.request.user
-        subcrubers = User.objects.filter(following__user=user)
-        pagination = self.paginate_queryset(subcrubers)
-        serializer = SubscriptionSerializer(
-            pagination,
-            many=True,
-            context={'request': request}
+        subcrubers = self.get_subscriptions_queryset(
+            User.objects.filter(following__user=user)
         )
+        pagination = self.paginate_queryset(subcrubers)
+        serializer = self.get_serializer(pagination, many=True)
         return self.get_paginated_response(serializer.data)
 
 
-class TagsViewSet(viewsets.ReadOnlyModelViewSet):
+class TagsViewSet(TimedSerializerMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tags.objects.all()
     serializer_class = TagsSerializer
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        return conditional_response(
+            tags_etag, super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return conditional_response(
+            tags_etag, super().retrieve, request, *args, **kwargs
+        )
 
-class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
+
+class IngredientsViewSet(
+    TimedSerializerMixin, viewsets.ReadOnlyModelViewSet
+):
     queryset = Ingredients.objects.all()
     serializer_class = IngredientsSerializer
     filter_backends = [DjangoFilterBackend]
     pagination_class = None
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        return conditional_response(
+            ingredients_etag, self.get_ingredients, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return conditional_response(
+            ingredients_etag, super().retrieve, request, *args, **kwargs
+        )
+
+    def get_ingredients(self, request, *args, **kwargs):
+        search = request.query_params.get('search', '').strip()
+        if search:
+            ingredients = search_similar(search, INGREDIENT_SEARCH_LIMIT)
+        else:
+            ingredients = ingredient_index.search(
+                request.query_params.get('name', '')
+            )
+        serializer = self.get_serializer(ingredients, many=True)
+        return Response(serializer.data)
+
 
-class RecipesViewSet(viewsets.ModelViewSet):
+class RecipesViewSet(TimedSerializerMixin, viewsets.ModelViewSet):
     queryset = Recipes.objects.all()
-    pagination_class = LimitPageNumberPaginator
+    pagination_class = FeedPaginator
+    keyset_ordering = ('-is_published', '-id')
+    shared = False
     permission_classes = (IsAuthorOrAdminOrReadOnly, )
     filterset_class = TagsFilter
 
+    def get_queryset(self):
+        queryset = self.queryset.defer('search_vector').select_related(
+            'author'
+        ).prefetch_related(
+            'tags',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredients.objects.select_related(
+                    'ingredients'
+                )
+            ),
+        )
+        user = self.request.user
+        if self.shared or user.is_anonymous:
+            return queryset
+        return queryset.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+        )
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['shared'] = self.shared
+        return context
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        """Ответ из общего кеша с флагами текущего пользователя.
+
+        В кеше хранится представление без пользовательских флагов,
+        одинаковое для всех; флаги избранного, корзины и подписки
+        накладываются поверх по множествам id пользователя.
+        """
+        if any(param in request.query_params for param in USER_FILTERS):
+            return handler(request, *args, **kwargs)
+        key = recipes_cache.get_key(request)
+        data = recipes_cache.get(key)
+        cache_status = 'HIT'
+        if data is None:
+            cache_status = 'MISS'
+            if self.action == 'list':
+                versions = recipes_cache.get_versions(
+                    [version_key(COLLECTION)]
+                )
+            else:
+                versions = recipes_cache.get_versions(
+                    [version_key('recipe', kwargs[self.lookup_field])]
+                )
+            self.shared = True
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            recipes_cache.set(key, data, versions)
+        if not request.user.is_anonymous:
+            data = overlay_user_flags(data, get_user_flags(request.user))
+        return Response(data, headers={'X-Cache': cache_status})
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return conditional_response(
+            recipe_etag, self.get_cached_detail, request, *args, **kwargs
+        )
+
+    def get_cached_detail(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
             return RecipesListSerializer
@@ -171,6 +364,66 @@ class RecipesViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def change_recipes_batch(self, request, model):
+        """Добавить или убрать несколько рецептов одним запросом.
+
+        Тело - {"recipes": [id, ...]}, в ответе статус по каждому id:
+        created/exists при добавлении, deleted/absent при удалении,
+        not_found для несуществующих рецептов.
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = list(dict.fromkeys(serializer.validated_data['recipes']))
+        if request.method == 'POST':
+            changed, linked = link_recipes(model, request.user, recipe_ids)
+            statuses = {
+                **{recipe_id: 'created' for recipe_id in changed},
+                **{recipe_id: 'exists' for recipe_id in linked},
+            }
+        else:
+            changed = unlink_recipes(model, request.user, recipe_ids)
+            found = set(
+                Recipes.objects.filter(
+                    id__in=set(recipe_ids) - changed
+                ).values_list('id', flat=True)
+            )
+            statuses = {
+                **{recipe_id: 'absent' for recipe_id in found},
+                **{recipe_id: 'deleted' for recipe_id in changed},
+            }
+        if changed:
+            invalidate_user_flags(request.user)
+        return Response({'results': [
+            {'id': recipe_id, 'status': statuses.get(recipe_id, 'not_found')}
+            for recipe_id in recipe_ids
+        ]})
+
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        permission_classes=[IsAuthenticated],
+        url_path='favorite',
+        url_name='favorite-batch',
+    )
+    def favorite_batch(self, request):
+        return self.change_recipes_batch(request, Favorite)
+
+    @action(
+        detail=False,
+        methods=['POST', 'DELETE'],
+        permission_classes=[IsAuthenticated],
+        url_path='shopping_cart',
+        url_name='shopping-cart-batch',
+    )
+    def shopping_cart_batch(self, request):
+        return self.change_recipes_batch(request, ShoppingCart)
+
+    def recipe_link_missing(self, pk, message):
+        """Вставка не добавила строку: рецепта нет или связь уже есть."""
+        if not Recipes.objects.filter(pk=pk).exists():
+            raise NotFound('Рецепт не найден.')
+        return Response(message, status=status.HTTP_204_NO_CONTENT)
+
     @action(
         detail=True,
         methods=['POST', 'DELETE'],
@@ -178,31 +431,29 @@ class RecipesViewSet(viewsets.ModelViewSet):
         url_path='favorite'
     )
     def favorite(self, request, pk):
-        fav = request.user.favorite.filter(recipe_id=pk)
+        pk = parse_id(pk)
         if request.method == 'POST':
-            if fav.exists():
-                return Response(
-                    'Рецепт уже в избранном',
-                    status=status.HTTP_204_NO_CONTENT
-                )
-            serializer = FavoriteSerializer(
-                Favorite.objects.create(user=request.user, recipe_id=pk)
+            favorite = insert_unique(
+                Favorite, 'recipe', user=request.user.pk, recipe=pk
             )
+            if favorite is None:
+                return self.recipe_link_missing(pk, 'Рецепт уже в избранном')
+            invalidate_user_flags(request.user)
             return Response(
-                serializer.data,
+                time_serialization(FavoriteSerializer(favorite)).data,
                 status=status.HTTP_201_CREATED
             )
-        if request.method == 'DELETE':
-            if fav.exists():
-                fav.delete()
-                return Response(
-                    'Рецепт удален из избранного',
-                    status=status.HTTP_204_NO_CONTENT
-                )
+        deleted, _ = request.user.favorite.filter(recipe_id=pk).delete()
+        if not deleted:
             return Response(
                 'Рецепт уже удален из избранного',
                 status=status.HTTP_404_NOT_FOUND
             )
+        invalidate_user_flags(request.user)
+        return Response(
+            'Рецепт удален из избранного',
+            status=status.HTTP_204_NO_CONTENT
+        )
 
     @action(
         detail=True,
@@ -211,34 +462,35 @@ class RecipesViewSet(viewsets.ModelViewSet):
         url_path='shopping_cart'
     )
     def shopping_cart(self, request, pk):
-        cart = request.user.shopping_cart.filter(recipe_id=pk)
+        pk = parse_id(pk)
         if request.method == 'POST':
-            if cart.exists():
-                return Response(
-                    'Рецепт уже в списке покупок',
-                    status=status.HTTP_204_NO_CONTENT
+            with transaction.atomic():
+                cart_item = insert_unique(
+                    ShoppingCart, 'recipe', user=request.user.pk, recipe=pk
                 )
-            serializer = ShoppingCartSerializer(
-                ShoppingCart.objects.create(
-                    user=request.user,
-                    recipe_id=pk
+                if cart_item is not None:
+                    add_to_shopping_cart_totals(request.user, [pk])
+                    invalidate_user_flags(request.user)
+            if cart_item is None:
+                return self.recipe_link_missing(
+                    pk, 'Рецепт уже в списке покупок'
                 )
-            )
             return Response(
-                serializer.data,
+                time_serialization(ShoppingCartSerializer(cart_item)).data,
                 status=status.HTTP_201_CREATED
             )
-        elif request.method == 'DELETE':
-            if cart.exists():
-                cart.delete()
-                return Response(
-                    'Рецепт удален из списка покупок',
-                    status=status.HTTP_204_NO_CONTENT
-                )
+        deleted = unlink_recipes(ShoppingCart, request.user, [pk])
+        if deleted:
+            invalidate_user_flags(request.user)
+        if not deleted:
             return Response(
                 'Рецепт уже удален из списка покупок',
                 status=status.HTTP_404_NOT_FOUND
             )
+        return Response(
+            'Рецепт удален из списка покупок',
+            status=status.HTTP_204_NO_CONTENT
+        )
 
     @action(
         detail=False,
@@ -247,23 +499,38 @@ class RecipesViewSet(viewsets.ModelViewSet):
         url_path='download_shopping_cart'
     )
     def download_shopping_cart(self, request):
-        ingredients_list = RecipeIngredients.objects.filter(
-            recipes__in=request.user.shopping_cart.values('recipe')
-        ).values(
-            'ingredients__name', 'ingredients__measurement_unit'
-        ).annotate(
-            sum_amount=Sum('amount')
-        )
-        shopping_list = 'Список покупок:\n'
-        for i, unit in enumerate(ingredients_list, 1):
-            shopping_list += (
-                f"{i}. {unit['ingredients__name']} - "
-                f"{unit['sum_amount']} "
-                f"{unit['ingredients__measurement_unit']}\n"
+        file_type = request.query_params.get('type', 'txt')
+        group_by = request.query_params.get('group_by')
+        if file_type not in EXPORT_FORMATS:
+            return Response(
+                f'Доступные форматы: {", ".join(EXPORT_FORMATS)}',
+                status=status.HTTP_400_BAD_REQUEST
             )
-        response = HttpResponse(shopping_list, content_type='text/plain')
+        if group_by is not None and group_by not in GROUP_BY_FIELDS:
+            return Response(
+                f'Доступные группировки: {", ".join(GROUP_BY_FIELDS)}',
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        ordering = ('ingredient__name', 'ingredient__measurement_unit')
+        if group_by is not None:
+            ordering = (GROUP_BY_FIELDS[group_by],) + ordering
+        ingredients_list = request.user.shopping_cart_ingredients.order_by(
+            *ordering
+        ).values_list(
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            'amount',
+        )
+        render, content_type, filename = EXPORT_FORMATS[file_type]
+        response = StreamingHttpResponse(
+            render(
+                ingredients_list.iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE),
+                group_by
+            ),
+            content_type=content_type
+        )
         response['Content-Disposition'] = (
-            'attachment; filename="shopping_list.txt"'
+            f'attachment; filename="{filename}"'
         )
         return response
 
@@ -271,29 +538,48 @@ class RecipesViewSet(viewsets.ModelViewSet):
 @api_view(['GET'])
 def short_link(request, recipe_id):
     """Получение короткой ссылки."""
-    recipes = get_object_or_404(Recipes, id=recipe_id)
-    if ShortLink.objects.filter(
-        origin_url=recipes.get_absolute_url()
-    ).exists():
-        serializer = ShortLinksSerializer(
-            ShortLink.objects.get(origin_url=recipes.get_absolute_url())
+    if not Recipes.objects.filter(id=recipe_id).exists():
+        raise NotFound()
+    return Response({'short-link': request.build_absolute_uri(
+        f'/s/{encode_recipe_id(recipe_id)}'
+    )})
+
+
+def get_full_link(request, short_link):
+    """Получение оригинальной ссылки.
+
+    Код нового формата раскодируется в id рецепта без запроса к базе,
+    старые коды ищутся в ShortLink по индексу с кешированием.
+    """
+    recipe_id = decode_recipe_id(short_link)
+    if recipe_id is not None:
+        SHORT_LINK_REDIRECTS.labels('canonical').inc()
+        return redirect(
+            get_frontend_path(Recipes(pk=recipe_id).get_absolute_url())
         )
-        return Response(serializer.data)
-    domain = request.scheme + "://" + request.META.get('HTTP_HOST') + '/s/'
-    short_url = domain + (
-        ''.join(random.sample(ascii_letters, SIZE_SHORT_URL))
-    )
-    link, _ = ShortLink.objects.get_or_create(
-        origin_url=recipes.get_absolute_url(),
-        short_url=short_url
+    origin_url = (
+        resolve_legacy_link(short_link) if is_legacy_code(short_link)
+        else None
     )
-    serializer = ShortLinksSerializer(link)
-    return Response(serializer.data)
+    if origin_url is None:
+        SHORT_LINK_REDIRECTS.labels('not_found').inc()
+        raise Http404
+    SHORT_LINK_REDIRECTS.labels('legacy').inc()
+    return redirect(get_frontend_path(origin_url))
 
 
-def get_full_link(request, short_link):
-    """Получение оригинальной ссылки."""
-    domain = request.scheme + "://" + get_current_site(request).name + '/s/'
-    url = get_object_or_404(ShortLink, short_url=domain + short_link)
-    link = url.origin_url.replace('/api', '', 1)[:-1]
-    return redirect(link)
+def metrics(request):
+    """Метрики в формате Prometheus.
+
+    Доступны, только если METRICS_ENABLED, и только с адресов из
+    METRICS_ALLOWED_NETWORKS.
+    """
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if not is_allowed(
+        request.META.get('REMOTE_ADDR', ''),
+        settings.METRICS_ALLOWED_NETWORKS,
+    ):
+        return HttpResponseForbidden()
+    body, content_type = render_metrics()
+    return HttpResponse(body, content_type=content_type)
@@ -3,13 +3,13 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
-from api.views import get_full_link
+from api.views import get_full_link, metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
-    path('s/<str:short_link>/', get_full_link),
-
+    path('s/<str:short_link>/', get_full_link, name='short-link'),
+    path('metrics', metrics, name='metrics'),
 ]
 
 if settings.DEBUG:
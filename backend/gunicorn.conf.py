@@ -0,0 +1,51 @@
+"""Настройки gunicorn.
+
+Метрики Prometheus собираются из файлов всех воркеров в каталоге
+PROMETHEUS_MULTIPROC_DIR: при старте мастера каталог очищается от
+данных прошлого запуска, а завершившиеся воркеры помечаются через
+mark_process_dead.
+
+Ответы, версии ключей и флаги пользователей хранятся в кеше Django,
+поэтому несколько воркеров должны использовать общий кеш: с LocMemCache
+каждый воркер видел бы свои версии и отдавал устаревшие ответы. Такая
+конфигурация останавливает запуск.
+"""
+import os
+import shutil
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', 1))
+
+LOCAL_CACHE_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+def check_shared_cache():
+    if workers < 2:
+        return
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    from django.conf import settings
+
+    for alias, options in settings.CACHES.items():
+        if options['BACKEND'] == LOCAL_CACHE_BACKEND:
+            raise RuntimeError(
+                f'Кеш {alias!r} ({options["BACKEND"]}) не общий для '
+                f'{workers} воркеров: задайте CACHE_BACKEND=redis или '
+                'GUNICORN_WORKERS=1.'
+            )
+
+
+def on_starting(server):
+    check_shared_cache()
+    directory = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if not directory:
+        return
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    if not os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        return
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,149 @@
+"""Уменьшенные копии загруженных изображений.
+
+Для каждого изображения рецепта и аватара строятся варианты thumb, card
+и full в JPEG и WebP без метаданных. Варианты создаются в пуле потоков
+после фиксации транзакции и лежат в подкаталоге variants рядом с
+оригиналом под именами, которые однозначно выводятся из его имени.
+Файлы, на которые больше нет ссылок, удаляет команда collect_media.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from recipes.storage import DERIVED_DIRS
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = DERIVED_DIRS[0]
+VARIANTS = {
+    'thumb': (160, 160),
+    'card': (480, 480),
+    'full': (1280, 1280),
+}
+FORMATS = {
+    'jpeg': ('jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+    'webp': ('webp', {'quality': 80, 'method': 4}),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_name(name, variant, image_format):
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    extension = FORMATS[image_format][0]
+    return os.path.join(
+        directory, VARIANTS_DIR, f'{stem}_{variant}.{extension}'
+    ).replace(os.sep, '/')
+
+
+def variant_names(name):
+    return [
+        variant_name(name, variant, image_format)
+        for variant in VARIANTS for image_format in FORMATS
+    ]
+
+
+def variant_urls(name, storage=default_storage):
+    return {
+        variant: {
+            image_format: storage.url(
+                variant_name(name, variant, image_format)
+            )
+            for image_format in FORMATS
+        }
+        for variant in VARIANTS
+    }
+
+
+def encode(image, image_format):
+    """Сохранить изображение в память, EXIF и прочие метаданные не пишутся."""
+    if image_format == 'jpeg' and image.mode != 'RGB':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        rgba = image.convert('RGBA')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        image = background
+    elif image_format == 'webp' and image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    buffer = BytesIO()
+    image.save(buffer, format=image_format.upper(), **FORMATS[image_format][1])
+    return buffer.getvalue()
+
+
+def variants_are_fresh(name, storage=default_storage):
+    """Все варианты есть и построены не раньше оригинала.
+
+    Имя удаленного оригинала может достаться новому файлу, поэтому
+    одного наличия вариантов недостаточно.
+    """
+    names = variant_names(name)
+    if not all(storage.exists(path) for path in names):
+        return False
+    try:
+        modified = storage.get_modified_time(name)
+        return all(
+            storage.get_modified_time(path) >= modified for path in names
+        )
+    except NotImplementedError:
+        return True
+
+
+def generate_variants(name, storage=default_storage, force=False):
+    """Построить недостающие или устаревшие варианты изображения name."""
+    if not force and variants_are_fresh(name, storage):
+        return
+    with storage.open(name, 'rb') as file:
+        source = Image.open(file)
+        source = ImageOps.exif_transpose(source)
+        source.load()
+    for variant, size in VARIANTS.items():
+        image = source.copy()
+        image.thumbnail(size, Image.LANCZOS)
+        for image_format in FORMATS:
+            path = variant_name(name, variant, image_format)
+            if storage.exists(path):
+                storage.delete(path)
+            storage.save(path, ContentFile(encode(image, image_format)))
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_PROCESSING_WORKERS,
+                thread_name_prefix='image-variants',
+            )
+    return _executor
+
+
+def process_image(name):
+    try:
+        generate_variants(name)
+    except FileNotFoundError:
+        logger.warning('Изображение %s не найдено', name)
+    except Exception:
+        logger.exception('Не удалось построить варианты %s', name)
+
+
+def schedule_variants(name):
+    """Построить варианты после фиксации транзакции.
+
+    При IMAGE_PROCESSING_WORKERS = 0 варианты строятся сразу в потоке
+    запроса.
+    """
+    if not name:
+        return
+    if not settings.IMAGE_PROCESSING_WORKERS:
+        transaction.on_commit(lambda: process_image(name))
+        return
+    transaction.on_commit(lambda: get_executor().submit(process_image, name))
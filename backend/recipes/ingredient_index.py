@@ -0,0 +1,173 @@
+"""Индекс ингредиентов в памяти процесса для автодополнения."""
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict, namedtuple
+from hashlib import md5
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+
+from recipes.models import Ingredients
+
+VERSION_CACHE_KEY = 'ingredients:index-version'
+WORD_RE = re.compile(r'\w+')
+SIMILARITY_THRESHOLD = 0.3
+
+IngredientEntry = namedtuple(
+    'IngredientEntry', ('id', 'name', 'measurement_unit')
+)
+
+
+def trigrams(value):
+    """Триграммы строки по правилам pg_trgm."""
+    result = set()
+    for word in WORD_RE.findall(value.casefold()):
+        word = f'  {word} '
+        result.update(word[i:i + 3] for i in range(len(word) - 2))
+    return result
+
+
+class IngredientIndex:
+    """Отсортированный по названию список ингредиентов.
+
+    Поиск по префиксу - два бинарных поиска по списку ключей. Индекс
+    перестраивается, если в кеше сменилась версия ингредиентов или
+    истек INGREDIENT_INDEX_TTL: сигналы сбрасывают его только в своем
+    процессе, а TTL ограничивает устаревание в остальных.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []
+        self._entries = []
+        self._trigrams = {}
+        self._trigram_counts = []
+        self._digest = None
+        self._version = None
+        self._built_at = None
+
+    @staticmethod
+    def normalize(value):
+        return value.strip().casefold()
+
+    def build(self):
+        version = cache.get(VERSION_CACHE_KEY, 0)
+        entries = sorted(
+            (
+                IngredientEntry(*row)
+                for row in Ingredients.objects.values_list(
+                    'id', 'name', 'measurement_unit'
+                ).iterator()
+            ),
+            key=lambda entry: (self.normalize(entry.name), entry.id)
+        )
+        index = defaultdict(list)
+        trigram_counts = []
+        digest = md5()
+        for position, entry in enumerate(entries):
+            digest.update(
+                f'{entry.id}|{entry.name}|{entry.measurement_unit}\n'.encode()
+            )
+            entry_trigrams = trigrams(entry.name)
+            trigram_counts.append(len(entry_trigrams))
+            for trigram in entry_trigrams:
+                index[trigram].append(position)
+        with self._lock:
+            self._entries = entries
+            self._keys = [self.normalize(entry.name) for entry in entries]
+            self._trigrams = dict(index)
+            self._trigram_counts = trigram_counts
+            self._digest = digest.hexdigest()
+            self._version = version
+            self._built_at = time.monotonic()
+
+    def warm_up(self):
+        """Построить индекс при старте, если база уже доступна."""
+        try:
+            self.build()
+        except DatabaseError:
+            pass
+
+    def invalidate(self):
+        try:
+            cache.incr(VERSION_CACHE_KEY)
+        except ValueError:
+            cache.set(VERSION_CACHE_KEY, 1, None)
+        with self._lock:
+            self._built_at = None
+
+    def is_fresh(self):
+        return (
+            self._built_at is not None
+            and time.monotonic() - self._built_at
+            < settings.INGREDIENT_INDEX_TTL
+            and cache.get(VERSION_CACHE_KEY, 0) == self._version
+        )
+
+    def refresh(self):
+        if not self.is_fresh():
+            self.build()
+
+    @property
+    def digest(self):
+        """Хеш содержимого индекса, одинаковый во всех процессах."""
+        self.refresh()
+        return self._digest
+
+    def search(self, prefix=''):
+        """Ингредиенты, название которых начинается с prefix.
+
+        Точное совпадение - наименьший ключ с этим префиксом, поэтому в
+        отсортированном списке оно идет первым, остальные - по алфавиту.
+        """
+        self.refresh()
+        with self._lock:
+            keys, entries = self._keys, self._entries
+        prefix = self.normalize(prefix)
+        if not prefix:
+            return list(entries)
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + chr(0x10FFFF), start)
+        return entries[start:end]
+
+    def similar(self, query, limit):
+        """Ингредиенты, похожие на query, по убыванию сходства триграмм."""
+        self.refresh()
+        with self._lock:
+            index, counts = self._trigrams, self._trigram_counts
+            entries = self._entries
+        query_trigrams = trigrams(query)
+        shared = Counter()
+        for trigram in query_trigrams:
+            shared.update(index.get(trigram, ()))
+        ranked = []
+        for position, common in shared.items():
+            similarity = common / (
+                len(query_trigrams) + counts[position] - common
+            )
+            if similarity >= SIMILARITY_THRESHOLD:
+                ranked.append((-similarity, position))
+        ranked.sort()
+        return [entries[position] for _, position in ranked[:limit]]
+
+
+ingredient_index = IngredientIndex()
+
+
+def search_similar(query, limit):
+    """Нечеткий поиск ингредиентов.
+
+    На PostgreSQL используется GIN-индекс pg_trgm, на остальных базах -
+    индекс триграмм в памяти процесса с тем же порогом сходства.
+    """
+    if connection.vendor != 'postgresql':
+        return ingredient_index.similar(query, limit)
+    return Ingredients.objects.filter(
+        name__trigram_similar=query
+    ).annotate(
+        similarity=TrigramSimilarity('name', query)
+    ).order_by('-similarity', 'name')[:limit]
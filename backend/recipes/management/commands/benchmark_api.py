@@ -0,0 +1,210 @@
+import json
+import math
+import os
+import statistics
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.authtoken.models import Token
+
+from users.models import User
+
+ENDPOINTS = {
+    'recipes': ('/api/recipes/?limit={limit}', False),
+    'subscriptions': ('/api/users/subscriptions/?limit={limit}', True),
+    'ingredients': ('/api/ingredients/?name={prefix}', False),
+    'download_shopping_cart': ('/api/recipes/download_shopping_cart/', True),
+}
+PAGED = ('recipes', 'subscriptions')
+LIMITS = (6, 20, 100)
+INGREDIENT_PREFIX = 'са'
+REPEAT = 20
+WARMUP = 2
+METRICS = ('p50_ms', 'p95_ms', 'queries', 'sql_ms', 'peak_kb')
+
+
+def percentile(values, share):
+    """Процентиль по ближайшему рангу."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(share * len(ordered)) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет задержку, число и время SQL-запросов и пик памяти '
+        'основных эндпоинтов API через тестовый клиент и сверяет их '
+        'с бюджетом.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--endpoints', nargs='+', choices=ENDPOINTS,
+            default=tuple(ENDPOINTS),
+            help='Какие эндпоинты замерять.',
+        )
+        parser.add_argument(
+            '--limits', nargs='+', type=int, default=LIMITS,
+            help='Размеры страниц для постраничных эндпоинтов.',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=REPEAT,
+            help='Сколько раз выполнять каждый запрос.',
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=WARMUP,
+            help='Сколько запросов выполнить до замеров.',
+        )
+        parser.add_argument(
+            '--user',
+            help='Email пользователя, по умолчанию - у кого больше всего '
+                 'подписок и рецептов в корзине.',
+        )
+        parser.add_argument(
+            '--warm', action='store_true',
+            help='Не очищать кеши перед запросами и замерять ответы из '
+                 'прогретого кеша.',
+        )
+        parser.add_argument(
+            '--budget',
+            default=f'{settings.BASE_DIR}/data/benchmark_budget.json',
+            help='Файл с бюджетами, проверка пропускается, если его нет.',
+        )
+        parser.add_argument(
+            '--output', help='Сохранить результаты в JSON-файл.',
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.client = Client(
+            HTTP_AUTHORIZATION=f'Token {self.get_token(options["user"])}'
+        )
+        self.anonymous = Client()
+        results = {}
+        hosts = ['testserver', *settings.ALLOWED_HOSTS]
+        with override_settings(ALLOWED_HOSTS=hosts):
+            for name in options['endpoints']:
+                limits = options['limits'] if name in PAGED else (None,)
+                for limit in limits:
+                    case = name if limit is None else f'{name}:{limit}'
+                    results[case] = self.measure(name, limit)
+                    self.stdout.write(self.format_row(case, results[case]))
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, indent=2, ensure_ascii=False)
+        self.check_budget(results, options['budget'])
+
+    def get_token(self, email):
+        users = User.objects.all()
+        if email:
+            users = users.filter(email=email)
+        user = users.annotate(
+            subscriptions=Count('follower', distinct=True),
+            cart=Count('shopping_cart', distinct=True),
+        ).order_by('-subscriptions', '-cart', 'id').first()
+        if user is None:
+            raise CommandError(
+                'Нет пользователей, сначала выполните generate_dataset.'
+            )
+        return Token.objects.get_or_create(user=user)[0].key
+
+    def request(self, name, limit):
+        """Выполнить запрос и прочитать ответ целиком.
+
+        Потоковый ответ формируется при чтении, поэтому без чтения его
+        время и память не попали бы в замер.
+        """
+        path, authorized = ENDPOINTS[name]
+        client = self.client if authorized else self.anonymous
+        response = client.get(
+            path.format(limit=limit, prefix=INGREDIENT_PREFIX)
+        )
+        if response.status_code != 200:
+            raise CommandError(
+                f'{name}: ответ {response.status_code}, ожидался 200.'
+            )
+        if response.streaming:
+            return b''.join(response.streaming_content)
+        return response.content
+
+    def clear_caches(self):
+        if not self.options['warm']:
+            for cache in caches.all():
+                cache.clear()
+
+    def measure(self, name, limit):
+        """Задержка и SQL по repeat запросам, память - отдельным запросом.
+
+        tracemalloc замедляет выполнение в разы, поэтому пик памяти
+        снимается после замеров времени, чтобы не искажать их.
+        """
+        for _ in range(self.options['warmup']):
+            self.request(name, limit)
+        latencies, queries, sql_times = [], [], []
+        for _ in range(self.options['repeat']):
+            self.clear_caches()
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                self.request(name, limit)
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(len(context.captured_queries))
+            sql_times.append(sum(
+                float(query['time']) for query in context.captured_queries
+            ) * 1000)
+        self.clear_caches()
+        tracemalloc.start()
+        try:
+            self.request(name, limit)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return {
+            'p50_ms': round(percentile(latencies, 0.5), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'queries': max(queries),
+            'sql_ms': round(statistics.median(sql_times), 2),
+            'peak_kb': round(peak / 1024, 1),
+        }
+
+    def format_row(self, case, result):
+        return (
+            f'{case:<28} p50 {result["p50_ms"]:>8.2f} мс  '
+            f'p95 {result["p95_ms"]:>8.2f} мс  '
+            f'SQL {result["queries"]:>3} / {result["sql_ms"]:>7.2f} мс  '
+            f'память {result["peak_kb"]:>9.1f} КБ'
+        )
+
+    def check_budget(self, results, path):
+        """Сравнить результаты с бюджетом.
+
+        Ключи файла - имя эндпоинта или имя с размером страницы через
+        двоеточие, значения - пределы метрик из METRICS. Бюджет для
+        конкретного размера страницы дополняет общий.
+        """
+        if not os.path.exists(path):
+            return
+        with open(path) as file:
+            budget = json.load(file)
+        exceeded = []
+        for case, result in results.items():
+            limits = {
+                **budget.get(case.split(':')[0], {}),
+                **budget.get(case, {}),
+            }
+            exceeded += [
+                f'{case}: {metric} = {result[metric]}, '
+                f'бюджет {limits[metric]}'
+                for metric in METRICS
+                if metric in limits and result[metric] > limits[metric]
+            ]
+        if exceeded:
+            raise CommandError(
+                'Превышен бюджет:\n' + '\n'.join(exceeded)
+            )
+        self.stdout.write(self.style.SUCCESS('Бюджет соблюден.'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import generate_variants
+from recipes.models import Recipes
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Строит уменьшенные копии изображений рецептов и аватаров.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Перестроить копии, даже если они уже есть.',
+        )
+
+    def handle(self, *args, **options):
+        names = set(
+            Recipes.objects.exclude(image='').values_list('image', flat=True)
+        ) | set(
+            User.objects.exclude(avatar='').exclude(
+                avatar__isnull=True
+            ).values_list('avatar', flat=True)
+        )
+        failed = 0
+        for name in sorted(names):
+            try:
+                generate_variants(name, force=options['force'])
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'{name}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {len(names) - failed}, '
+            f'с ошибками: {failed}.'
+        ))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+
+from recipes.services import (
+    calculate_shopping_cart_totals,
+    get_shopping_cart_totals,
+    rebuild_shopping_cart_totals,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет суммы ингредиентов корзин с корзинами пользователей '
+        'и при необходимости пересчитывает их.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Пересчитать суммы для пользователей с расхождениями.',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересчитать суммы всех пользователей.',
+        )
+
+    def handle(self, *args, **options):
+        if options['all']:
+            totals = rebuild_shopping_cart_totals()
+            self.stdout.write(self.style.SUCCESS(
+                f'Суммы пересчитаны для {len(totals)} пользователей.'
+            ))
+            return
+        expected = calculate_shopping_cart_totals()
+        stored = get_shopping_cart_totals()
+        broken = sorted(
+            user_id for user_id in expected.keys() | stored.keys()
+            if expected.get(user_id, {}) != stored.get(user_id, {})
+        )
+        if not broken:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
+            return
+        self.stdout.write(self.style.WARNING(
+            f'Расхождения у пользователей: {", ".join(map(str, broken))}'
+        ))
+        if options['rebuild']:
+            rebuild_shopping_cart_totals(broken)
+            self.stdout.write(self.style.SUCCESS(
+                f'Суммы пересчитаны для {len(broken)} пользователей.'
+            ))
@@ -0,0 +1,86 @@
+import posixpath
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.images import variant_names
+from recipes.models import Recipes
+from users.models import User
+
+MEDIA_DIRS = (
+    Recipes._meta.get_field('image').upload_to,
+    User._meta.get_field('avatar').upload_to,
+)
+
+
+def walk(storage, directory):
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        yield from walk(storage, posixpath.join(directory, name))
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет из MEDIA_ROOT изображения, на которые не ссылается '
+        'ни один рецепт или пользователь, вместе с их вариантами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, что будет удалено.',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=60,
+            help='Не трогать файлы моложе указанного числа минут.',
+        )
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        referenced = set(
+            Recipes.objects.values_list('image', flat=True)
+        ) | set(
+            User.objects.exclude(avatar__isnull=True).values_list(
+                'avatar', flat=True
+            )
+        )
+        referenced.discard('')
+        keep = referenced | {
+            variant for name in referenced for variant in variant_names(name)
+        }
+        threshold = timezone.now() - timedelta(minutes=options['min_age'])
+        names = []
+        for directory in MEDIA_DIRS:
+            directory = directory.rstrip('/')
+            if storage.exists(directory):
+                names.extend(walk(storage, directory))
+        # Свежий файл может быть загружен повторно, а ссылка на него
+        # еще не сохранена: вместе с ним остаются и его варианты.
+        recent = {
+            name for name in names
+            if storage.get_modified_time(name) > threshold
+        }
+        keep |= recent | {
+            variant for name in recent for variant in variant_names(name)
+        }
+        removed = size = 0
+        for name in names:
+            if name in keep:
+                continue
+            removed += 1
+            size += storage.size(name)
+            if options['dry_run']:
+                self.stdout.write(name)
+            else:
+                storage.delete(name)
+        action = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов: {removed}, {size / 1024 / 1024:.1f} МБ.'
+        ))
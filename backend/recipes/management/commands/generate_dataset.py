@@ -0,0 +1,457 @@
+import csv
+import io
+import random
+import time
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+from django.db.models import Max
+from PIL import Image
+
+from api.cache import COLLECTION, bump_versions, version_key
+from recipes.images import generate_variants
+from recipes.models import (
+    RECIPE_SEARCH_VECTOR,
+    Favorite,
+    Ingredients,
+    RecipeIngredients,
+    Recipes,
+    ShoppingCart,
+    Tags,
+)
+from recipes.services import rebuild_shopping_cart_totals
+from users.models import Subscriber, User
+
+USERNAME_PREFIX = 'dataset-'
+BATCH_SIZE = 5000
+AUTHOR_SKEW = 1.2
+INGREDIENT_SKEW = 1.0
+RECIPE_SKEW = 1.1
+INGREDIENTS_MEAN = 8
+INGREDIENTS_DEVIATION = 3
+MAX_INGREDIENTS = 20
+MAX_TAGS = 3
+AMOUNTS = (1, 2, 3, 5, 10, 20, 50, 100, 150, 200, 250, 300, 500, 1000)
+DEFAULT_TAGS = (
+    ('Завтрак', 'breakfast'),
+    ('Обед', 'lunch'),
+    ('Ужин', 'dinner'),
+    ('Десерт', 'dessert'),
+    ('Выпечка', 'baking'),
+    ('Перекус', 'snack'),
+)
+ADJECTIVES = (
+    'Домашний', 'Быстрый', 'Летний', 'Острый', 'Сытный', 'Легкий',
+    'Праздничный', 'Бабушкин', 'Пряный', 'Простой',
+)
+DISHES = (
+    'суп', 'салат', 'пирог', 'омлет', 'плов', 'соус', 'десерт',
+    'гарнир', 'бутерброд', 'кекс', 'борщ', 'шашлык',
+)
+SENTENCES = (
+    'Подготовьте все ингредиенты заранее.',
+    'Нарежьте овощи небольшими кубиками.',
+    'Доведите до кипения и убавьте огонь.',
+    'Перемешайте и оставьте на несколько минут.',
+    'Выпекайте до золотистой корочки.',
+    'Посолите и поперчите по вкусу.',
+    'Подавайте горячим со свежей зеленью.',
+    'Храните в холодильнике не больше двух дней.',
+)
+PLACEHOLDER_NAME = 'recipes/images/dataset.jpg'
+PLACEHOLDER_SIZE = (480, 480)
+COPY_NULL = '\\N'
+
+
+def zipf_cum_weights(size, skew):
+    """Накопленные веса закона Ципфа для рангов 1..size."""
+    return list(accumulate(1 / rank ** skew for rank in range(1, size + 1)))
+
+
+def sample_distinct(rng, population, cum_weights, count):
+    """count разных элементов population, выбранных с весами."""
+    count = min(count, len(population) // 2 or 1)
+    result = set()
+    while len(result) < count:
+        result.update(rng.choices(
+            population, cum_weights=cum_weights, k=count - len(result)
+        ))
+    return sorted(result)
+
+
+def draw_count(rng, mean):
+    return int(rng.expovariate(1 / mean)) if mean > 0 else 0
+
+
+def copy_objects(model, objects):
+    """Записать объекты одной командой COPY.
+
+    Значения готовятся так же, как в bulk_create, поэтому auto_now и
+    поля с файлами заполняются одинаково на всех базах.
+    """
+    fields = [
+        field for field in model._meta.concrete_fields
+        if not (field.primary_key and objects[0].pk is None)
+    ]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for obj in objects:
+        values = (
+            field.get_db_prep_save(field.pre_save(obj, True), connection)
+            for field in fields
+        )
+        writer.writerow(
+            COPY_NULL if value is None else value for value in values
+        )
+    buffer.seek(0)
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {quote(model._meta.db_table)} ({columns}) '
+            f"FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')",
+            buffer
+        )
+
+
+def get_dependent_relations(model):
+    """Обратные связи, по которым удаление строк model затрагивает другие."""
+    return [
+        field for field in model._meta.get_fields(include_hidden=True)
+        if field.auto_created and not field.concrete
+        and (field.one_to_many or field.one_to_one)
+        and field.on_delete in (models.CASCADE, models.SET_NULL)
+    ]
+
+
+def delete_rows(queryset, batch_size):
+    """Удалить строки queryset и зависящие от них пачками по batch_size.
+
+    В отличие от QuerySet.delete() объекты не загружаются и сигналы не
+    отправляются: каскад проходит по связям моделей, строки удаляются
+    запросами DELETE ... WHERE ... IN по id пачки. Возвращает число
+    удаленных строк queryset.
+    """
+    model = queryset.model
+    relations = get_dependent_relations(model)
+    if not relations:
+        return queryset._raw_delete(connection.alias)
+    pks = queryset.order_by('pk').values_list('pk', flat=True)
+    deleted = 0
+    while True:
+        batch = list(pks[:batch_size])
+        if not batch:
+            return deleted
+        with transaction.atomic():
+            for relation in relations:
+                dependent = relation.related_model._base_manager.filter(
+                    **{f'{relation.field.name}__in': batch}
+                )
+                if relation.on_delete is models.SET_NULL:
+                    dependent.update(**{relation.field.name: None})
+                else:
+                    delete_rows(dependent, batch_size)
+            deleted += model._base_manager.filter(
+                pk__in=batch
+            )._raw_delete(connection.alias)
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерирует воспроизводимый набор пользователей, рецептов, '
+        'избранного, корзин и подписок для нагрузочного тестирования. '
+        'В среднем на рецепт приходится 8 ингредиентов: 125 рецептов '
+        'дают около 1 тыс. строк RecipeIngredients, 1,25 млн - около 10 млн.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int, default=1000,
+            help='Количество рецептов.',
+        )
+        parser.add_argument(
+            '--users', type=int,
+            help='Количество пользователей, по умолчанию - рецептов / 5.',
+        )
+        parser.add_argument(
+            '--favorites', type=float, default=10,
+            help='Среднее число избранных рецептов у пользователя.',
+        )
+        parser.add_argument(
+            '--cart', type=float, default=3,
+            help='Среднее число рецептов в корзине пользователя.',
+        )
+        parser.add_argument(
+            '--subscriptions', type=float, default=5,
+            help='Среднее число подписок пользователя.',
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Начальное значение генератора случайных чисел.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Сколько объектов записывать за раз.',
+        )
+        parser.add_argument(
+            '--password', default='dataset-password',
+            help='Общий пароль сгенерированных пользователей.',
+        )
+        parser.add_argument(
+            '--replace', action='store_true',
+            help='Удалить ранее сгенерированный набор перед созданием.',
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        users = options['users'] or max(options['recipes'] // 5, 10)
+        generated = User.objects.filter(username__startswith=USERNAME_PREFIX)
+        if generated.exists():
+            if not options['replace']:
+                raise CommandError(
+                    'Набор уже сгенерирован, используйте --replace.'
+                )
+            self.delete_generated(generated)
+        started = time.monotonic()
+        ingredient_ids = self.get_ingredient_ids()
+        tag_ids = self.get_tag_ids()
+        image = self.save_placeholder()
+        user_ids = self.create_users(users, options['password'])
+        recipe_ids = self.create_recipes(
+            options['recipes'], user_ids, ingredient_ids, tag_ids, image
+        )
+        self.create_relations(user_ids, recipe_ids, options)
+        self.reset_sequences()
+        self.finish(user_ids[0])
+        self.stdout.write(self.style.SUCCESS(
+            f'Набор создан за {time.monotonic() - started:.1f} с. '
+            f'Пароль пользователей: {options["password"]}'
+        ))
+
+    def delete_generated(self, generated):
+        """Удалить прежний набор без загрузки объектов и сигналов.
+
+        Суммы корзин остальных пользователей, в которых были рецепты
+        набора, пересчитываются один раз в конце.
+        """
+        started = time.monotonic()
+        affected = list(
+            ShoppingCart.objects.filter(
+                recipe__author__in=generated
+            ).exclude(user__in=generated).values_list(
+                'user_id', flat=True
+            ).distinct()
+        )
+        deleted = delete_rows(generated, self.batch_size)
+        rebuild_shopping_cart_totals(affected)
+        bump_versions([version_key(COLLECTION)])
+        self.report('Удалено пользователей прежнего набора', deleted, started)
+
+    def report(self, label, count, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'{label}: {count} '
+            f'({count / elapsed if elapsed else count:.0f} в секунду)'
+        )
+
+    def write(self, objects):
+        if not objects:
+            return
+        if connection.vendor == 'postgresql':
+            copy_objects(type(objects[0]), objects)
+        else:
+            type(objects[0]).objects.bulk_create(
+                objects, batch_size=self.batch_size
+            )
+
+    def next_id(self, model):
+        return (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+    def get_ingredient_ids(self):
+        if not Ingredients.objects.exists():
+            call_command('import_csv', stdout=self.stdout)
+        return list(
+            Ingredients.objects.order_by('id').values_list('id', flat=True)
+        )
+
+    def get_tag_ids(self):
+        if not Tags.objects.exists():
+            Tags.objects.bulk_create(
+                (Tags(name=name, slug=slug) for name, slug in DEFAULT_TAGS),
+                ignore_conflicts=True,
+            )
+        return list(Tags.objects.order_by('id').values_list('id', flat=True))
+
+    def save_placeholder(self):
+        """Одно изображение на все рецепты, варианты строятся сразу."""
+        buffer = io.BytesIO()
+        Image.new('RGB', PLACEHOLDER_SIZE, (230, 180, 120)).save(
+            buffer, format='JPEG'
+        )
+        name = default_storage.save(
+            PLACEHOLDER_NAME, ContentFile(buffer.getvalue())
+        )
+        generate_variants(name)
+        return name
+
+    def create_users(self, count, password):
+        started = time.monotonic()
+        password = make_password(password)
+        first_id = self.next_id(User)
+        for start in range(0, count, self.batch_size):
+            numbers = range(start, min(start + self.batch_size, count))
+            self.write([
+                User(
+                    id=first_id + number,
+                    username=f'{USERNAME_PREFIX}{number}',
+                    email=f'{USERNAME_PREFIX}{number}@example.com',
+                    first_name='Пользователь',
+                    last_name=str(number),
+                    password=password,
+                )
+                for number in numbers
+            ])
+        self.report('Пользователи', count, started)
+        return list(range(first_id, first_id + count))
+
+    def create_recipes(self, count, user_ids, ingredient_ids, tag_ids, image):
+        """Рецепты с ингредиентами и тегами.
+
+        Авторы и ингредиенты выбираются по закону Ципфа среди случайно
+        упорядоченных id: несколько авторов пишут большую часть
+        рецептов, а у ингредиентов длинный хвост редких.
+        """
+        started = time.monotonic()
+        rng = self.rng
+        authors = rng.sample(user_ids, len(user_ids))
+        author_weights = zipf_cum_weights(len(authors), AUTHOR_SKEW)
+        ingredients = rng.sample(ingredient_ids, len(ingredient_ids))
+        ingredient_weights = zipf_cum_weights(
+            len(ingredients), INGREDIENT_SKEW
+        )
+        first_id = self.next_id(Recipes)
+        Tagged = Recipes.tags.through
+        links = 0
+        numbers = iter(range(count))
+        while True:
+            batch = list(islice(numbers, self.batch_size))
+            if not batch:
+                break
+            recipes, recipe_ingredients, recipe_tags = [], [], []
+            for number in batch:
+                recipe_id = first_id + number
+                recipes.append(Recipes(
+                    id=recipe_id,
+                    author_id=rng.choices(
+                        authors, cum_weights=author_weights
+                    )[0],
+                    name=(
+                        f'{rng.choice(ADJECTIVES)} {rng.choice(DISHES)} '
+                        f'№{number + 1}'
+                    ),
+                    text=' '.join(rng.sample(SENTENCES, rng.randint(2, 4))),
+                    image=image,
+                    cooking_time=rng.randint(5, 180),
+                ))
+                size = round(
+                    rng.gauss(INGREDIENTS_MEAN, INGREDIENTS_DEVIATION)
+                )
+                for ingredient_id in sample_distinct(
+                    rng, ingredients, ingredient_weights,
+                    min(max(size, 1), MAX_INGREDIENTS)
+                ):
+                    recipe_ingredients.append(RecipeIngredients(
+                        recipes_id=recipe_id,
+                        ingredients_id=ingredient_id,
+                        amount=rng.choice(AMOUNTS),
+                    ))
+                recipe_tags += [
+                    Tagged(recipes_id=recipe_id, tags_id=tag_id)
+                    for tag_id in rng.sample(
+                        tag_ids, rng.randint(1, min(MAX_TAGS, len(tag_ids)))
+                    )
+                ]
+            with transaction.atomic():
+                self.write(recipes)
+                self.write(recipe_ingredients)
+                self.write(recipe_tags)
+            links += len(recipe_ingredients)
+        self.report('Рецепты', count, started)
+        self.stdout.write(f'Ингредиенты рецептов: {links}')
+        return list(range(first_id, first_id + count))
+
+    def create_relations(self, user_ids, recipe_ids, options):
+        """Избранное, корзины и подписки.
+
+        Популярность рецептов и авторов тоже подчиняется закону Ципфа,
+        число связей у пользователя распределено экспоненциально.
+        """
+        started = time.monotonic()
+        rng = self.rng
+        recipes = rng.sample(recipe_ids, len(recipe_ids))
+        recipe_weights = zipf_cum_weights(len(recipes), RECIPE_SKEW)
+        authors = rng.sample(user_ids, len(user_ids))
+        author_weights = zipf_cum_weights(len(authors), AUTHOR_SKEW)
+        total = 0
+        for start in range(0, len(user_ids), self.batch_size):
+            favorites, carts, subscriptions = [], [], []
+            for user_id in user_ids[start:start + self.batch_size]:
+                favorites += [
+                    Favorite(user_id=user_id, recipe_id=recipe_id)
+                    for recipe_id in sample_distinct(
+                        rng, recipes, recipe_weights,
+                        draw_count(rng, options['favorites'])
+                    )
+                ]
+                carts += [
+                    ShoppingCart(user_id=user_id, recipe_id=recipe_id)
+                    for recipe_id in sample_distinct(
+                        rng, recipes, recipe_weights,
+                        draw_count(rng, options['cart'])
+                    )
+                ]
+                subscriptions += [
+                    Subscriber(user_id=user_id, author_id=author_id)
+                    for author_id in sample_distinct(
+                        rng, authors, author_weights,
+                        draw_count(rng, options['subscriptions'])
+                    )
+                    if author_id != user_id
+                ]
+            with transaction.atomic():
+                self.write(favorites)
+                self.write(carts)
+                self.write(subscriptions)
+            total += len(favorites) + len(carts) + len(subscriptions)
+        self.report('Избранное, корзины и подписки', total, started)
+
+    def reset_sequences(self):
+        """Сдвинуть последовательности после вставки с явными id."""
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                no_style(), [User, Recipes]
+            ):
+                cursor.execute(sql)
+
+    def finish(self, first_user_id):
+        """Пересчитать то, что обычно поддерживают сигналы и сервисы."""
+        started = time.monotonic()
+        rebuild_shopping_cart_totals(
+            User.objects.filter(id__gte=first_user_id).values('id')
+        )
+        if connection.vendor == 'postgresql':
+            Recipes.objects.filter(
+                author_id__gte=first_user_id
+            ).update(search_vector=RECIPE_SEARCH_VECTOR)
+        self.stdout.write(
+            'Суммы корзин и поисковые векторы пересчитаны за '
+            f'{time.monotonic() - started:.1f} с.'
+        )
+        bump_versions([version_key(COLLECTION), version_key('tags')])
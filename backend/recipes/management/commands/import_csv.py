@@ -1,27 +1,189 @@
 import csv
+import io
+import json
+import sys
+import time
+from itertools import islice
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from api.cache import bump_versions, version_key
+from recipes.ingredient_index import ingredient_index
 from recipes.models import Ingredients
 
+BATCH_SIZE = 1000
+READ_SIZE = 64 * 1024
+FORMATS = ('csv', 'json')
+
+
+def normalize(value):
+    return ' '.join(value.split())
+
+
+def get_key(name, measurement_unit):
+    """Естественный ключ ингредиента без учета регистра и пробелов."""
+    return normalize(name).casefold(), normalize(measurement_unit).casefold()
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+        elif any(row):
+            yield None
 
-class Command(BaseCommand):
-    def handle(self, *args, **kwargs):
 
+def read_json(file):
+    """Объекты из JSON-массива или JSON Lines без чтения файла целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n[,]':
+            position += 1
+        if position == len(buffer):
+            if eof:
+                return
+            buffer = file.read(READ_SIZE)
+            position = 0
+            eof = not buffer
+            continue
         try:
-            with open(
-                f'{settings.BASE_DIR}/data/ingredients.csv',
-                'r',
-                encoding='utf-8',
-            ) as category:
-                category_reader = csv.reader(category)
-                Ingredients.objects.all().delete()
-                Ingredients.objects.bulk_create(
-                    Ingredients(
-                        name=row[0],
-                        measurement_unit=row[1])
-                    for row in category_reader)
-        except FileNotFoundError:
-            raise TypeError('Файл не найден!')
-        self.stdout.write(self.style.SUCCESS('Файл успешно загружен!'))
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise CommandError('Некорректный JSON.')
+            chunk = file.read(READ_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        position = end
+        if isinstance(item, dict):
+            yield item.get('name'), item.get('measurement_unit')
+        else:
+            yield None
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает ингредиенты из CSV (название, единица измерения) или '
+        'JSON: добавляет новые и исправляет написание существующих, '
+        'ничего не удаляя.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=f'{settings.BASE_DIR}/data/ingredients.csv',
+            help='Путь к файлу или "-" для чтения из stdin.',
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='Формат данных, по умолчанию - по расширению файла.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Сколько строк записывать за раз.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Посчитать изменения, не записывая их.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        data_format = options['format'] or (
+            'json' if path.endswith('.json') else 'csv'
+        )
+        if path == '-':
+            file = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+        else:
+            try:
+                file = open(path, encoding='utf-8', newline='')
+            except FileNotFoundError:
+                raise CommandError(f'Файл {path} не найден!')
+        started = time.monotonic()
+        with file:
+            rows = read_json(file) if data_format == 'json' else read_csv(
+                file
+            )
+            stats, updated_ids = self.import_rows(
+                rows, options['batch_size'], options['dry_run']
+            )
+        elapsed = time.monotonic() - started
+        if not options['dry_run'] and (stats['inserted'] or updated_ids):
+            bump_versions([
+                version_key('ingredients'),
+                *(version_key('ingredient', pk) for pk in updated_ids),
+            ])
+            ingredient_index.invalidate()
+        total = sum(stats.values())
+        prefix = 'Без записи в базу: ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}добавлено {stats["inserted"]}, '
+            f'обновлено {stats["updated"]}, '
+            f'без изменений {stats["unchanged"]}, '
+            f'пропущено {stats["skipped"]} '
+            f'({total / elapsed if elapsed else total:.0f} строк/с).'
+        ))
+
+    def import_rows(self, rows, batch_size, dry_run):
+        existing = {
+            get_key(name, measurement_unit): (pk, name, measurement_unit)
+            for pk, name, measurement_unit in Ingredients.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            ).iterator()
+        }
+        seen = set()
+        stats = dict.fromkeys(
+            ('inserted', 'updated', 'unchanged', 'skipped'), 0
+        )
+        updated_ids = []
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return stats, updated_ids
+            new, changed = [], []
+            for row in batch:
+                if row is None or not all(
+                    isinstance(value, str) and value.strip() for value in row
+                ):
+                    stats['skipped'] += 1
+                    continue
+                name, measurement_unit = map(normalize, row)
+                key = get_key(name, measurement_unit)
+                if key in seen:
+                    stats['unchanged'] += 1
+                    continue
+                seen.add(key)
+                if key not in existing:
+                    new.append(Ingredients(
+                        name=name, measurement_unit=measurement_unit
+                    ))
+                elif existing[key][1:] != (name, measurement_unit):
+                    changed.append(Ingredients(
+                        pk=existing[key][0],
+                        name=name,
+                        measurement_unit=measurement_unit,
+                    ))
+                else:
+                    stats['unchanged'] += 1
+            stats['inserted'] += len(new)
+            stats['updated'] += len(changed)
+            updated_ids += [ingredient.pk for ingredient in changed]
+            if dry_run:
+                continue
+            with transaction.atomic():
+                Ingredients.objects.bulk_create(new)
+                Ingredients.objects.bulk_update(
+                    changed, ('name', 'measurement_unit')
+                )
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.3 on 2026-10-18 04:29
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='favorite',
+            options={'default_related_name': 'favorite', 'ordering': ('recipe',), 'verbose_name': 'Избранный рецепт', 'verbose_name_plural': 'избранные рецепты'},
+        ),
+        migrations.AlterModelOptions(
+            name='recipeingredients',
+            options={'default_related_name': 'recipe_ingredients', 'ordering': ('recipes',), 'verbose_name': 'Ингредиент рецепта', 'verbose_name_plural': 'Ингредиенты рецепта'},
+        ),
+        migrations.AlterModelOptions(
+            name='shoppingcart',
+            options={'default_related_name': 'shopping_cart', 'ordering': ('recipe',), 'verbose_name': 'Корзина', 'verbose_name_plural': 'корзины покупок'},
+        ),
+        migrations.AlterModelOptions(
+            name='shortlink',
+            options={'ordering': ('short_url',), 'verbose_name': 'Короткая ссылка', 'verbose_name_plural': 'Короткие ссылки'},
+        ),
+        migrations.AlterField(
+            model_name='recipeingredients',
+            name='amount',
+            field=models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(32000)], verbose_name='Количество'),
+        ),
+        migrations.AlterField(
+            model_name='recipes',
+            name='cooking_time',
+            field=models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(32000)], verbose_name='Время приготовления'),
+        ),
+        migrations.AddIndex(
+            model_name='recipes',
+            index=models.Index(fields=['author', '-is_published'], name='recipes_author_published_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.3 on 2026-10-18 04:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipes_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipes',
+            index=models.Index(fields=['-is_published', '-id'], name='recipes_published_id_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.3 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+def fill_codes(apps, schema_editor):
+    ShortLink = apps.get_model('recipes', 'ShortLink')
+    links = []
+    for link in ShortLink.objects.only('short_url').iterator():
+        link.code = link.short_url.rstrip('/').rsplit('/', 1)[-1]
+        links.append(link)
+    ShortLink.objects.bulk_update(links, ('code',), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipes_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shortlink',
+            name='code',
+            field=models.CharField(blank=True, db_index=True, max_length=16, verbose_name='Код'),
+        ),
+        migrations.RunPython(fill_codes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+from django.db.models.functions import Length
+
+CANONICAL_CODE_LENGTH = 6
+
+
+def delete_canonical_links(apps, schema_editor):
+    """Канонические коды вычисляются из id, хранить их не нужно."""
+    ShortLink = apps.get_model('recipes', 'ShortLink')
+    ShortLink.objects.annotate(
+        code_length=Length('code')
+    ).filter(code_length=CANONICAL_CODE_LENGTH).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_shortlink_code'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            delete_canonical_links, migrations.RunPython.noop
+        ),
+    ]
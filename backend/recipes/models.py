@@ -1,3 +1,5 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
 from django.urls import reverse
 from django.core.validators import MinValueValidator, MaxValueValidator
@@ -6,6 +8,11 @@ from users.models import User
 
 MIN_COUNT = 1
 MAX_COUNT = 32000
+SEARCH_CONFIG = 'russian'
+RECIPE_SEARCH_VECTOR = (
+    SearchVector('name', weight='A', config=SEARCH_CONFIG)
+    + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+)
 
 
 class Tags (models.Model):
@@ -89,12 +96,35 @@ class Recipes (models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-is_published',)
         default_related_name = 'recipes'
+        indexes = [
+            models.Index(
+                fields=('author', '-is_published'),
+                name='recipes_author_published_idx'
+            ),
+            models.Index(
+                fields=('-is_published', '-id'),
+                name='recipes_published_id_idx'
+            ),
+            GinIndex(
+                fields=('search_vector',),
+                name='recipes_search_vector_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -157,6 +187,32 @@ class ShoppingCart(models.Model):
         return f'{self.recipe}'
 
 
+class ShoppingCartIngredient(models.Model):
+    """Модель суммарного количества ингредиента в корзине."""
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredients, on_delete=models.CASCADE, verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Ингредиент корзины'
+        verbose_name_plural = 'ингредиенты корзины'
+        default_related_name = 'shopping_cart_ingredients'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_ingredient_in_shopping_cart'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} {self.amount}'
+
+
 class Favorite(models.Model):
     """Модель избранного."""
 
@@ -193,6 +249,9 @@ class ShortLink(models.Model):
     short_url = models.CharField(
         max_length=132, verbose_name='Короткая ссылка', unique=True
     )
+    code = models.CharField(
+        max_length=16, blank=True, db_index=True, verbose_name='Код'
+    )
 
     class Meta:
         verbose_name = 'Короткая ссылка'
@@ -0,0 +1,340 @@
+"""Избранное и корзины пользователей, суммарный список покупок."""
+from collections import defaultdict
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
+
+from recipes.models import (
+    RecipeIngredients,
+    Recipes,
+    ShoppingCart,
+    ShoppingCartIngredient,
+)
+
+BATCH_SIZE = 1000
+SQLITE_RETURNING_VERSION = (3, 35)
+
+
+def supports_returning():
+    """Поддерживает ли база INSERT/DELETE ... RETURNING.
+
+    SQLite умеет это с версии 3.35, а Django 3.2 не отражает это в
+    connection.features, поэтому версия библиотеки проверяется явно.
+    """
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return (
+            connection.Database.sqlite_version_info
+            >= SQLITE_RETURNING_VERSION
+        )
+    return False
+
+
+def get_recipes_amounts(recipe_ids):
+    """Суммарное количество каждого ингредиента в рецептах."""
+    return dict(
+        RecipeIngredients.objects.filter(
+            recipes_id__in=recipe_ids
+        ).values('ingredients').annotate(
+            total=Sum('amount')
+        ).order_by().values_list('ingredients', 'total')
+    )
+
+
+def apply_shopping_cart_delta(user_ids, delta):
+    """Изменить суммы ингредиентов в корзинах пользователей на delta.
+
+    delta - словарь {id ингредиента: изменение количества}.
+    """
+    delta = {
+        ingredient_id: amount
+        for ingredient_id, amount in delta.items() if amount
+    }
+    if not user_ids or not delta:
+        return
+    with transaction.atomic():
+        ShoppingCartIngredient.objects.bulk_create(
+            (
+                ShoppingCartIngredient(
+                    user_id=user_id, ingredient_id=ingredient_id, amount=0
+                )
+                for user_id in user_ids
+                for ingredient_id, amount in delta.items() if amount > 0
+            ),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        totals = ShoppingCartIngredient.objects.filter(
+            user_id__in=user_ids, ingredient_id__in=delta
+        )
+        totals.update(amount=Greatest(
+            F('amount') + Case(
+                *(
+                    When(ingredient_id=ingredient_id, then=Value(amount))
+                    for ingredient_id, amount in delta.items()
+                ),
+                default=Value(0),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        ))
+        totals.filter(amount=0).delete()
+
+
+def add_to_shopping_cart_totals(user, recipe_ids):
+    apply_shopping_cart_delta([user.id], get_recipes_amounts(recipe_ids))
+
+
+def remove_from_shopping_cart_totals(user, recipe_ids):
+    apply_shopping_cart_delta([user.id], {
+        ingredient_id: -amount
+        for ingredient_id, amount in get_recipes_amounts(recipe_ids).items()
+    })
+
+
+def get_shopping_cart_users(recipe):
+    return list(
+        ShoppingCart.objects.filter(recipe=recipe).values_list(
+            'user_id', flat=True
+        )
+    )
+
+
+def update_recipe_in_shopping_carts(recipe, old_amounts, new_amounts):
+    """Перенести изменение состава рецепта в корзины с этим рецептом."""
+    delta = {
+        ingredient_id: (
+            new_amounts.get(ingredient_id, 0)
+            - old_amounts.get(ingredient_id, 0)
+        )
+        for ingredient_id in old_amounts.keys() | new_amounts.keys()
+    }
+    apply_shopping_cart_delta(get_shopping_cart_users(recipe), delta)
+
+
+def calculate_shopping_cart_totals(user_ids=None):
+    """Суммы ингредиентов, посчитанные заново по корзинам.
+
+    Возвращает словарь {id пользователя: {id ингредиента: количество}}.
+    Условие на корзины задается одним filter: второй вызов по той же
+    многозначной связи добавил бы еще один JOIN и исказил суммы.
+    """
+    carts = {'recipes__shopping_cart__isnull': False}
+    if user_ids is not None:
+        carts = {'recipes__shopping_cart__user_id__in': user_ids}
+    recipe_ingredients = RecipeIngredients.objects.filter(**carts)
+    totals = defaultdict(dict)
+    for user_id, ingredient_id, amount in recipe_ingredients.values(
+        'recipes__shopping_cart__user', 'ingredients'
+    ).annotate(
+        total=Sum('amount')
+    ).order_by().values_list(
+        'recipes__shopping_cart__user', 'ingredients', 'total'
+    ).iterator(chunk_size=BATCH_SIZE):
+        totals[user_id][ingredient_id] = amount
+    return totals
+
+
+def get_shopping_cart_totals(user_ids=None):
+    """Суммы ингредиентов из таблицы ShoppingCartIngredient."""
+    stored = ShoppingCartIngredient.objects.all()
+    if user_ids is not None:
+        stored = stored.filter(user_id__in=user_ids)
+    totals = defaultdict(dict)
+    for user_id, ingredient_id, amount in stored.values_list(
+        'user_id', 'ingredient_id', 'amount'
+    ).iterator(chunk_size=BATCH_SIZE):
+        totals[user_id][ingredient_id] = amount
+    return totals
+
+
+def rebuild_shopping_cart_totals(user_ids=None):
+    """Пересчитать суммы ингредиентов корзин с нуля."""
+    totals = calculate_shopping_cart_totals(user_ids)
+    stored = ShoppingCartIngredient.objects.all()
+    if user_ids is not None:
+        stored = stored.filter(user_id__in=user_ids)
+    with transaction.atomic():
+        stored.delete()
+        ShoppingCartIngredient.objects.bulk_create(
+            (
+                ShoppingCartIngredient(
+                    user_id=user_id, ingredient_id=ingredient_id, amount=amount
+                )
+                for user_id, amounts in totals.items()
+                for ingredient_id, amount in amounts.items()
+            ),
+            batch_size=BATCH_SIZE,
+        )
+    return totals
+
+
+class ShoppingCartRebuild:
+    """Отложенный пересчет сумм корзин пользователей user_ids."""
+
+    def __init__(self, user_ids):
+        self.user_ids = set(user_ids)
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        rebuild_shopping_cart_totals(self.user_ids)
+
+
+def schedule_shopping_cart_rebuild(user_ids):
+    """Пересчитать суммы корзин user_ids после фиксации транзакции.
+
+    Так суммы поддерживаются при изменениях через ORM и админку, которые
+    не проходят через сервисы с дельтами. Все пользователи транзакции
+    собираются в один пересчет: удаление рецепта из тысяч корзин
+    каскадом не пересчитывает их по одной.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    for _, callback in transaction.get_connection().run_on_commit:
+        if isinstance(callback, ShoppingCartRebuild) and not callback.done:
+            callback.user_ids |= user_ids
+            return
+    transaction.on_commit(ShoppingCartRebuild(user_ids))
+
+
+def insert_unique(model, related_field, **values):
+    """Вставить строку одним запросом, не нарушая уникальность.
+
+    INSERT ... SELECT ... ON CONFLICT DO NOTHING RETURNING: строка
+    добавляется, только если существует объект, на который ссылается
+    related_field, и такой строки еще нет. Возвращает созданный объект
+    или None. Для баз без RETURNING - проверка связанного объекта и
+    вставка в точке сохранения.
+    """
+    opts = model._meta
+    attnames = {
+        opts.get_field(name).attname: value for name, value in values.items()
+    }
+    related_model = opts.get_field(related_field).remote_field.model
+    if not supports_returning():
+        if not related_model.objects.filter(
+            pk=values[related_field]
+        ).exists():
+            return None
+        try:
+            with transaction.atomic():
+                return model.objects.create(**attnames)
+        except IntegrityError:
+            return None
+    related = related_model._meta
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(opts.get_field(name).column) for name in values)
+    select = ', '.join(
+        quote(related.pk.column) if name == related_field else '%s'
+        for name in values
+    )
+    params = [
+        value for name, value in values.items() if name != related_field
+    ]
+    params.append(values[related_field])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(opts.db_table)} ({columns}) '
+            f'SELECT {select} FROM {quote(related.db_table)} '
+            f'WHERE {quote(related.pk.column)} = %s '
+            f'ON CONFLICT DO NOTHING RETURNING {quote(opts.pk.column)}',
+            params
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    return model(pk=row[0], **attnames)
+
+
+def insert_links(model, user, recipe_ids):
+    """Связать пользователя с существующими рецептами из recipe_ids.
+
+    Возвращает id рецептов, строки для которых вставил именно этот
+    запрос: RETURNING не вернет строку, вставленную параллельным
+    запросом, поэтому одну связь нельзя «добавить» дважды.
+    """
+    if not supports_returning():
+        return {
+            recipe_id for recipe_id in recipe_ids
+            if insert_unique(model, 'recipe', user=user.pk, recipe=recipe_id)
+        }
+    opts = model._meta
+    quote = connection.ops.quote_name
+    recipes = Recipes._meta
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(opts.db_table)} '
+            f'({quote(opts.get_field("user").column)}, '
+            f'{quote(opts.get_field("recipe").column)}) '
+            f'SELECT %s, {quote(recipes.pk.column)} '
+            f'FROM {quote(recipes.db_table)} '
+            f'WHERE {quote(recipes.pk.column)} IN ({placeholders}) '
+            f'ON CONFLICT DO NOTHING '
+            f'RETURNING {quote(opts.get_field("recipe").column)}',
+            [user.pk, *recipe_ids]
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def delete_links(model, user, recipe_ids):
+    """Удалить связи пользователя с рецептами, вернуть id удаленных.
+
+    Как и в insert_links, в результат попадают только строки, которые
+    удалил этот запрос, а не параллельный.
+    """
+    if not supports_returning():
+        links = model.objects.filter(user=user)
+        return {
+            recipe_id for recipe_id in recipe_ids
+            if links.filter(recipe_id=recipe_id)._raw_delete(links.db)
+        }
+    opts = model._meta
+    quote = connection.ops.quote_name
+    recipe_column = quote(opts.get_field('recipe').column)
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(opts.db_table)} '
+            f'WHERE {quote(opts.get_field("user").column)} = %s '
+            f'AND {recipe_column} IN ({placeholders}) '
+            f'RETURNING {recipe_column}',
+            [user.pk, *recipe_ids]
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def link_recipes(model, user, recipe_ids):
+    """Добавить рецепты в избранное или корзину (model) пользователя.
+
+    Возвращает (добавленные id, уже добавленные id); id несуществующих
+    рецептов в обоих множествах отсутствуют. Суммы ингредиентов корзины
+    меняются только для строк, вставленных этим запросом.
+    """
+    if not recipe_ids:
+        return set(), set()
+    with transaction.atomic():
+        created = insert_links(model, user, recipe_ids)
+        if model is ShoppingCart and created:
+            add_to_shopping_cart_totals(user, created)
+    found = set(
+        Recipes.objects.filter(
+            id__in=set(recipe_ids) - created
+        ).values_list('id', flat=True)
+    )
+    return created, found
+
+
+def unlink_recipes(model, user, recipe_ids):
+    """Убрать рецепты из избранного или корзины, вернуть id удаленных."""
+    if not recipe_ids:
+        return set()
+    with transaction.atomic():
+        deleted = delete_links(model, user, recipe_ids)
+        if model is ShoppingCart and deleted:
+            remove_from_shopping_cart_totals(user, deleted)
+    return deleted
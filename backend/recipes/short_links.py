@@ -0,0 +1,69 @@
+"""Короткие ссылки на рецепты без обращения к базе.
+
+Код - id рецепта, переставленный аффинным преобразованием по модулю
+62 ** CODE_LENGTH и записанный в base62 с перемешанным алфавитом.
+Преобразование обратимо, поэтому код раскодируется в id без запроса,
+а соседние id дают непохожие коды и в базе не хранятся. Старые
+случайные коды из семи букв ищутся в таблице ShortLink.
+"""
+from functools import lru_cache
+
+from recipes.models import ShortLink
+
+ALPHABET = 'HJkGvCZrBXq9oxznaj1ip5mEK20LusW6IFdVUP8fMRQbAghD3e7YywtT4NlcOS'
+BASE = len(ALPHABET)
+CODE_LENGTH = 6
+MODULUS = BASE ** CODE_LENGTH
+MULTIPLIER = 21729154149
+OFFSET = 56145686323
+INVERSE = pow(MULTIPLIER, -1, MODULUS)
+DIGITS = {char: value for value, char in enumerate(ALPHABET)}
+LEGACY_CODE_LENGTH = 7
+LEGACY_CACHE_SIZE = 4096
+
+
+def encode_recipe_id(recipe_id):
+    if not 0 < recipe_id < MODULUS:
+        raise ValueError(f'id {recipe_id} не помещается в короткий код.')
+    value = (recipe_id * MULTIPLIER + OFFSET) % MODULUS
+    chars = []
+    for _ in range(CODE_LENGTH):
+        value, digit = divmod(value, BASE)
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def decode_recipe_id(code):
+    """Id рецепта по коду или None, если это не код нового формата."""
+    if len(code) != CODE_LENGTH:
+        return None
+    value = 0
+    for char in code:
+        digit = DIGITS.get(char)
+        if digit is None:
+            return None
+        value = value * BASE + digit
+    recipe_id = (value - OFFSET) * INVERSE % MODULUS
+    return recipe_id or None
+
+
+def is_legacy_code(code):
+    return (
+        len(code) == LEGACY_CODE_LENGTH and code.isascii() and code.isalpha()
+    )
+
+
+@lru_cache(maxsize=LEGACY_CACHE_SIZE)
+def resolve_legacy_link(code):
+    """Исходная ссылка для старого кода.
+
+    Старые коды больше не создаются, поэтому кешируются и промахи.
+    """
+    return ShortLink.objects.filter(code=code).values_list(
+        'origin_url', flat=True
+    ).first()
+
+
+def get_frontend_path(origin_url):
+    """Путь страницы рецепта во фронтенде по его адресу в API."""
+    return origin_url.replace('/api', '', 1).rstrip('/')
@@ -0,0 +1,71 @@
+from django.db import connection
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from recipes.images import schedule_variants
+from recipes.ingredient_index import ingredient_index
+from recipes.models import (
+    RECIPE_SEARCH_VECTOR,
+    Ingredients,
+    RecipeIngredients,
+    Recipes,
+    ShoppingCart,
+)
+from recipes.services import schedule_shopping_cart_rebuild
+from users.models import User
+
+
+@receiver((post_save, post_delete), sender=Ingredients)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(post_save, sender=Recipes)
+def update_recipe_search_vector(sender, instance, **kwargs):
+    if connection.vendor != 'postgresql':
+        return
+    Recipes.objects.filter(pk=instance.pk).update(
+        search_vector=RECIPE_SEARCH_VECTOR
+    )
+
+
+IMAGE_FIELDS = {Recipes: 'image', User: 'avatar'}
+
+
+def image_is_saved(sender, update_fields):
+    return update_fields is None or IMAGE_FIELDS[sender] in update_fields
+
+
+@receiver(post_save, sender=Recipes)
+@receiver(post_save, sender=User)
+def process_image(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or not image_is_saved(sender, update_fields):
+        return
+    schedule_variants(getattr(instance, IMAGE_FIELDS[sender]).name)
+
+
+@receiver(pre_save, sender=ShoppingCart)
+def rebuild_previous_shopping_cart(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        return
+    schedule_shopping_cart_rebuild(
+        sender.objects.filter(pk=instance.pk).values_list('user_id', flat=True)
+    )
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def rebuild_shopping_cart(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    schedule_shopping_cart_rebuild([instance.user_id])
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredients)
+def rebuild_recipe_shopping_carts(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    schedule_shopping_cart_rebuild(
+        ShoppingCart.objects.filter(
+            recipe_id=instance.recipes_id
+        ).values_list('user_id', flat=True)
+    )
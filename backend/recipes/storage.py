@@ -0,0 +1,47 @@
+"""Хранилище медиафайлов с именами по содержимому."""
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+DERIVED_DIRS = ('variants',)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Файл называется sha256 своего содержимого.
+
+    Каталог из upload_to и расширение сохраняются. Повторная загрузка
+    того же файла не пишет его заново, а возвращает имя уже
+    сохраненного, поэтому один файл может принадлежать нескольким
+    объектам. Файлы без ссылок удаляет только команда collect_media,
+    не трогающая файлы моложе --min-age; повторная загрузка обновляет
+    время изменения файла, чтобы ссылка на него успела сохраниться.
+    Производные файлы из DERIVED_DIRS (уменьшенные копии) сохраняются
+    под переданным именем - оно уже выведено из хеша оригинала.
+    """
+
+    def get_content_name(self, name, content):
+        sha256 = hashlib.sha256()
+        for chunk in content.chunks():
+            sha256.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        directory = posixpath.dirname(name.replace(os.sep, '/'))
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(directory, sha256.hexdigest() + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        directory = posixpath.dirname(name.replace(os.sep, '/'))
+        if posixpath.basename(directory) in DERIVED_DIRS:
+            return super().save(name, content, max_length)
+        name = self.get_content_name(name, content)
+        if self.exists(name):
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)